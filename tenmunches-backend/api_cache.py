@@ -0,0 +1,110 @@
+"""
+Bounded async cache for the TenMunches API server.
+
+  - LRU: at most `max_entries` values are kept, so arbitrary request paths
+    can't grow the cache without limit.
+  - Single-flight: concurrent misses for a key share one load instead of
+    all hitting MongoDB at once.
+  - Stale-while-revalidate: for `stale_ttl` seconds after an entry's `ttl`
+    runs out it is still served, while one background load refreshes it.
+  - Invalidation: `invalidate()` drops every entry at once (the server
+    calls it when a refresh publishes new data). It is safe to call from
+    any thread.
+
+Loaders return the value to cache; None is cached too (e.g. "not found"),
+which the LRU bound keeps cheap. A load that fails is not cached and its
+error is raised to every waiter.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+Loader = Callable[[], Awaitable[Any]]
+
+
+class _Entry:
+    __slots__ = ("value", "loaded_at", "generation")
+
+    def __init__(self, value: Any, loaded_at: float, generation: int) -> None:
+        self.value = value
+        self.loaded_at = loaded_at
+        self.generation = generation
+
+
+class AsyncCache:
+    """LRU, single-flight, stale-while-revalidate cache of async loads."""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300, stale_ttl: float = 3600) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._inflight: dict[str, tuple[int, asyncio.Task]] = {}
+        self._generation = 0
+        self._generation_lock = threading.Lock()
+
+    async def get(self, key: str, loader: Loader) -> Any:
+        """Return the cached value for `key`, loading it if needed."""
+        entry = self._entries.get(key)
+        if entry is not None and entry.generation == self._generation:
+            age = time.monotonic() - entry.loaded_at
+            if age < self.ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                if age >= self.ttl:
+                    self._start_load(key, loader)  # revalidate in the background
+                return entry.value
+        return await asyncio.shield(self._start_load(key, loader))
+
+    def _start_load(self, key: str, loader: Loader) -> asyncio.Task:
+        """Return the in-flight load for `key`, starting one if there is none."""
+        generation = self._generation
+        inflight = self._inflight.get(key)
+        if inflight is not None and inflight[0] == generation:
+            return inflight[1]
+        # The load runs as its own task, so a cancelled request doesn't
+        # cancel it for everyone else waiting on the same key
+        task = asyncio.create_task(self._load(key, loader, generation))
+        task.add_done_callback(_retrieve_error)
+        self._inflight[key] = (generation, task)
+        return task
+
+    async def _load(self, key: str, loader: Loader, generation: int) -> Any:
+        try:
+            value = await loader()
+            if generation == self._generation:  # not invalidated meanwhile
+                self._store(key, value, generation)
+            return value
+        finally:
+            if self._inflight.get(key, (None, None))[0] == generation:
+                del self._inflight[key]
+
+    def _store(self, key: str, value: Any, generation: int) -> None:
+        self._entries[key] = _Entry(value, time.monotonic(), generation)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """Drop every entry (thread-safe; entries are discarded lazily)."""
+        with self._generation_lock:
+            self._generation += 1
+
+    def clear(self) -> None:
+        """Drop every entry now (call from the event loop thread)."""
+        self.invalidate()
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return sum(1 for e in self._entries.values() if e.generation == self._generation)
+
+
+def _retrieve_error(task: asyncio.Task) -> None:
+    """
+    Mark a failed load's error as retrieved: waiters get it re-raised, and a
+    failed background revalidation just keeps serving the stale value.
+    """
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,108 @@
+"""
+Async MongoDB read helpers for the TenMunches API server.
+
+Mirrors the read side of db.py (same functions, arguments and results) on
+Motor, so `async def` endpoints await MongoDB instead of holding a
+threadpool slot while blocked. Writes and index management stay in db.py,
+which the refresh pipeline uses.
+
+The client is created per event loop (Motor clients are bound to the loop
+they first run on) with pool sizes from MONGODB_MAX_POOL_SIZE /
+MONGODB_MIN_POOL_SIZE.
+"""
+
+import asyncio
+import os
+from typing import Any, Iterable
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo.errors import ConnectionFailure
+
+from cities import DEFAULT_CITY
+from db import DB_NAME, MONGODB_URI, build_projection
+
+load_dotenv()
+
+MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "5"))
+
+_client: AsyncIOMotorClient | None = None
+_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_client() -> AsyncIOMotorClient:
+    """Return the Motor client for the running event loop, creating it on first call."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        if not MONGODB_URI:
+            raise ValueError("MONGODB_URI not set in environment")
+        if _client is not None:
+            _client.close()
+        _client = AsyncIOMotorClient(
+            MONGODB_URI,
+            serverSelectionTimeoutMS=5000,
+            maxPoolSize=MAX_POOL_SIZE,
+            minPoolSize=MIN_POOL_SIZE,
+            maxIdleTimeMS=60_000,
+        )
+        _client_loop = loop
+    return _client
+
+
+def get_db() -> AsyncIOMotorDatabase:
+    """Return the tenmunches database handle."""
+    return get_client()[DB_NAME]
+
+
+async def ping() -> bool:
+    """Test the MongoDB connection. Returns True if healthy."""
+    try:
+        await get_client().admin.command("ping")
+        return True
+    except ConnectionFailure:
+        return False
+
+
+async def get_active_snapshot(city: str = DEFAULT_CITY) -> str | None:
+    """Return the version readers currently see for a city."""
+    doc = await get_db().snapshots.find_one({"_id": city}, {"active": 1})
+    return doc["active"] if doc else None
+
+
+async def get_all_categories(
+    city: str = DEFAULT_CITY,
+    fields: Iterable[str] | None = None,
+    exclude: Iterable[str] = (),
+) -> list[dict[str, Any]]:
+    """Return all category documents of a city's active snapshot, excluding _id."""
+    version = await get_active_snapshot(city)
+    if version is None:
+        return []
+    cursor = get_db().categories.find(
+        {"city": city, "snapshot": version}, build_projection(fields, exclude),
+    )
+    return await cursor.to_list(length=None)
+
+
+async def get_category(
+    name: str,
+    city: str = DEFAULT_CITY,
+    fields: Iterable[str] | None = None,
+    exclude: Iterable[str] = (),
+) -> dict[str, Any] | None:
+    """Return a single category document from a city's active snapshot."""
+    version = await get_active_snapshot(city)
+    if version is None:
+        return None
+    return await get_db().categories.find_one(
+        {"city": city, "snapshot": version, "category": name},
+        build_projection(fields, exclude),
+    )
+
+
+async def get_last_refresh(fields: Iterable[str] | None = None) -> dict[str, Any] | None:
+    """Return the most recent refresh log entry (only `fields`, if given)."""
+    projection = {"_id": 0, **{f: 1 for f in fields}} if fields is not None else {"_id": 0}
+    return await get_db().refresh_log.find_one({}, projection, sort=[("timestamp", -1)])
@@ -0,0 +1,91 @@
+"""
+City configuration and refresh partitioning for TenMunches.
+
+Data is partitioned by (city, category): every partition is searched,
+ranked and stored on its own, so refresh cost grows linearly with the
+number of cities and a refresh only ever rewrites its own partitions.
+
+Cities are configured in CITIES and enabled with REFRESH_CITIES (a
+comma-separated list of slugs). Partitions can be split across machines
+with REFRESH_SHARD="<index>/<count>": each partition is assigned to one
+shard by a stable hash, so every machine can compute its share alone.
+"""
+
+import hashlib
+import os
+from itertools import zip_longest
+from typing import Any
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CATEGORIES = [
+    "coffee", "pizza", "burger", "vegan", "bakery",
+    "brunch", "sushi", "thai", "chinese", "indian",
+    "mexican", "korean", "italian", "mediterranean", "seafood",
+    "sandwiches", "ice cream", "bars", "bbq", "ramen",
+]
+
+# slug -> name (used in search queries) and optional category override
+CITIES: dict[str, dict[str, Any]] = {
+    "san-francisco": {"name": "San Francisco"},
+    "oakland": {"name": "Oakland"},
+}
+
+DEFAULT_CITY = "san-francisco"
+
+ENABLED_CITIES = [
+    c.strip() for c in os.getenv("REFRESH_CITIES", DEFAULT_CITY).split(",") if c.strip()
+]
+
+Partition = tuple[str, str]  # (city slug, category)
+
+
+def _config(city: str) -> dict[str, Any]:
+    if city not in CITIES:
+        raise ValueError(f"Unknown city '{city}' (expected one of {sorted(CITIES)})")
+    return CITIES[city]
+
+
+def city_name(city: str) -> str:
+    """Search location for a city slug."""
+    return _config(city)["name"]
+
+
+def city_categories(city: str) -> list[str]:
+    return _config(city).get("categories", CATEGORIES)
+
+
+def partitions(cities: list[str] | None = None) -> list[Partition]:
+    """
+    Every (city, category) partition of `cities` (default: ENABLED_CITIES).
+
+    Cities are interleaved (one category of each city in turn), so workers
+    pulling partitions in order progress on every city at once instead of
+    finishing one city before starting the next.
+    """
+    cities = cities if cities is not None else ENABLED_CITIES
+    per_city = [[(city, category) for category in city_categories(city)] for city in cities]
+    return [p for group in zip_longest(*per_city) for p in group if p is not None]
+
+
+def shard(parts: list[Partition], index: int, count: int) -> list[Partition]:
+    """The partitions owned by shard `index` of `count` (stable across runs)."""
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index {index} out of range for {count} shards")
+    return [p for p in parts if _shard_of(p, count) == index]
+
+
+def _shard_of(partition: Partition, count: int) -> int:
+    digest = hashlib.sha1("/".join(partition).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """Parse "<index>/<count>" (e.g. "0/4")."""
+    try:
+        index, count = (int(x) for x in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}' (expected '<index>/<count>')") from None
+    return index, count
@@ -3,15 +3,24 @@ Cloudinary image upload service for TenMunches.
 
 Uploads place photos from Google Places API to Cloudinary CDN.
 Returns optimized CDN URLs with auto-format and quality transformations.
+
+For whole categories, `upload_photos` resolves which images already exist
+with batched Admin API lookups (up to 100 public_ids per call) and uploads
+only the missing or replaced ones, concurrently and under a shared rate
+limit.
 """
 
 import os
+from concurrent.futures import Executor
+from typing import Iterable
 
 import cloudinary
 import cloudinary.api
 import cloudinary.uploader
 from dotenv import load_dotenv
 
+from rate_limit import TokenBucket
+
 load_dotenv()
 
 # Configure Cloudinary from env vars
@@ -24,6 +33,12 @@ cloudinary.config(
 
 FOLDER = "tenmunches"
 
+# Edge length (px) of the square thumbnails served by the summary endpoint
+THUMBNAIL_SIZE = 320
+
+# Admin API limit on public_ids per resources_by_ids call
+LOOKUP_BATCH_SIZE = 100
+
 
 def upload_photo(image_url: str, place_id: str) -> str:
     """
@@ -49,11 +64,85 @@ def upload_photo(image_url: str, place_id: str) -> str:
                 return _optimized_url(existing["secure_url"])
         except cloudinary.api.NotFound:
             pass  # Image doesn't exist yet, will upload
+    except Exception as e:
+        print(f"  ⚠️  Cloudinary upload failed for {place_id}: {e}")
+        return ""
+
+    return _upload(image_url, place_id)
+
+
+def find_existing(place_ids: list[str]) -> dict[str, str]:
+    """
+    Return optimized CDN URLs for the place photos already on Cloudinary,
+    keyed by place_id, using one Admin API call per LOOKUP_BATCH_SIZE ids.
+    """
+    found: dict[str, str] = {}
+    prefix = f"{FOLDER}/"
+    for i in range(0, len(place_ids), LOOKUP_BATCH_SIZE):
+        batch = place_ids[i:i + LOOKUP_BATCH_SIZE]
+        result = cloudinary.api.resources_by_ids(
+            [f"{prefix}{pid}" for pid in batch],
+            max_results=len(batch),
+        )
+        for res in result.get("resources", []):
+            public_id = res.get("public_id", "")
+            if public_id.startswith(prefix) and res.get("secure_url"):
+                found[public_id[len(prefix):]] = _optimized_url(res["secure_url"])
+    return found
+
+
+def upload_photos(
+    photos: dict[str, str],
+    executor: Executor | None = None,
+    limiter: TokenBucket | None = None,
+    replace: Iterable[str] = (),
+) -> dict[str, str]:
+    """
+    Upload a batch of place photos, skipping ones Cloudinary already has.
+
+    Args:
+        photos: Source image URL keyed by place_id.
+        executor: Runs uploads concurrently when given (serially otherwise).
+        limiter: Shared rate limit applied to each upload call.
+        replace: place_ids whose stored image is outdated; these are
+            re-uploaded without an existence check.
+
+    Returns:
+        The optimized CDN URL keyed by place_id ("" where an upload failed).
+    """
+    photos = {pid: url for pid, url in photos.items() if url and url.startswith("http")}
+    if not photos:
+        return {}
+
+    replace = set(replace)
+    to_check = [pid for pid in photos if pid not in replace]
+    try:
+        urls = find_existing(to_check) if to_check else {}
+    except Exception as e:
+        print(f"  ⚠️  Cloudinary lookup failed, uploading all: {e}")
+        urls = {}
+
+    missing = [pid for pid in photos if pid not in urls]
 
-        # Upload from URL
+    def upload(place_id: str) -> str:
+        if limiter is not None:
+            limiter.acquire()
+        return _upload(photos[place_id], place_id)
+
+    if executor is None:
+        uploaded = [upload(pid) for pid in missing]
+    else:
+        uploaded = list(executor.map(upload, missing))
+    urls.update(zip(missing, uploaded))
+    return urls
+
+
+def _upload(image_url: str, place_id: str) -> str:
+    """Upload an image URL as `FOLDER/place_id`. Returns the CDN URL or ""."""
+    try:
         result = cloudinary.uploader.upload(
             image_url,
-            public_id=public_id,
+            public_id=f"{FOLDER}/{place_id}",
             overwrite=True,
             resource_type="image",
             transformation=[
@@ -79,6 +168,16 @@ def _optimized_url(url: str) -> str:
     return url.replace("/upload/", "/upload/f_auto,q_auto/")
 
 
+def thumbnail_url(url: str, size: int = THUMBNAIL_SIZE) -> str:
+    """Square `size`px crop of a Cloudinary image URL (other URLs are returned as-is)."""
+    if "/upload/" not in url:
+        return url
+    head, tail = url.split("/upload/", 1)
+    for transformation in ("f_auto,q_auto/", "q_auto,f_auto/"):
+        tail = tail.removeprefix(transformation)
+    return f"{head}/upload/c_fill,w_{size},h_{size},f_auto,q_auto/{tail}"
+
+
 def test_connection() -> bool:
     """Verify Cloudinary credentials are valid."""
     try:
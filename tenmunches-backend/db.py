@@ -3,25 +3,60 @@ MongoDB connection and CRUD helpers for TenMunches.
 
 Database: tenmunches
 Collections:
-  - categories: one document per food category, each contains top_10 array
-  - refresh_log: tracks when data was last refreshed
+  - categories: one document per (city, category) partition and snapshot
+    version, each contains a top_10 array; unique compound index on
+    (city, snapshot, category)
+  - snapshots: one pointer per city naming its active (and previous)
+    snapshot version; readers only see the active version
+  - places: per-place enrichment snapshots + fingerprints (incremental refresh)
+  - refresh_log: tracks when data was last refreshed; entries expire after
+    REFRESH_LOG_TTL_DAYS
+
+Indexes are created by ensure_indexes(), which the server runs on startup
+and the refresh runs before writing.
 """
 
 import os
+import re
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Callable, Iterable, Iterator
 
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo import ASCENDING, DESCENDING, MongoClient, ReplaceOne
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, OperationFailure
+
+from cities import DEFAULT_CITY
 
 load_dotenv()
 
 MONGODB_URI = os.getenv("MONGODB_URI", "")
 DB_NAME = "tenmunches"
 
+# Refresh log entries older than this are deleted by a TTL index
+REFRESH_LOG_TTL_DAYS = int(os.getenv("REFRESH_LOG_TTL_DAYS", "180"))
+
+# Heavy per-place fields that list views can leave out (see `exclude`)
+HEAVY_FIELDS = ("top_10.themes_summary",)
+
+# Just enough for a first paint: names, ratings and photos of every top 10
+SUMMARY_FIELDS = (
+    "city",
+    "category",
+    "top_10.id",
+    "top_10.name",
+    "top_10.rating",
+    "top_10.review_count",
+    "top_10.photo_url",
+)
+
+# A projectable field: a category field or one level into its top_10 entries
+_FIELD_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?")
+
 _client: MongoClient | None = None
 
+# Called with the city name whenever a city's active snapshot changes
+_publish_listeners: list[Callable[[str], None]] = []
+
 
 def get_client() -> MongoClient:
     """Return a singleton MongoClient, creating it on first call."""
@@ -47,37 +82,309 @@ def ping() -> bool:
         return False
 
 
+def ensure_indexes() -> None:
+    """Create the indexes the read and write paths rely on (idempotent)."""
+    db = get_db()
+    # Documents written before cities/snapshots existed belong to the default
+    # city's initial snapshot
+    db.categories.update_many({"city": {"$exists": False}}, {"$set": {"city": DEFAULT_CITY}})
+    db.categories.update_many(
+        {"snapshot": {"$exists": False}}, {"$set": {"snapshot": INITIAL_SNAPSHOT}}
+    )
+    for city in db.categories.distinct("city", {"snapshot": INITIAL_SNAPSHOT}):
+        db.snapshots.update_one(
+            {"_id": city},
+            {"$setOnInsert": {"active": INITIAL_SNAPSHOT, "previous": None}},
+            upsert=True,
+        )
+
+    try:
+        db.categories.drop_index("city_category")  # superseded by city_snapshot_category
+    except OperationFailure:
+        pass
+    db.categories.create_index(
+        [("city", ASCENDING), ("snapshot", ASCENDING), ("category", ASCENDING)],
+        unique=True,
+        name="city_snapshot_category",
+    )
+    db.places.create_index("id", unique=True, name="place_id")
+
+    # Newest-first reads of the refresh log; the same index expires old entries
+    ttl = REFRESH_LOG_TTL_DAYS * 24 * 3600
+    try:
+        db.refresh_log.create_index(
+            [("timestamp", DESCENDING)], name="timestamp_ttl", expireAfterSeconds=ttl,
+        )
+    except OperationFailure:
+        # The TTL changed since the index was created
+        db.command("collMod", "refresh_log", index={"name": "timestamp_ttl", "expireAfterSeconds": ttl})
+
+
+def build_projection(fields: Iterable[str] | None, exclude: Iterable[str]) -> dict[str, int]:
+    """
+    Build a find() projection: only `fields` if given, otherwise everything
+    but `exclude`. Dotted paths reach into embedded documents and arrays
+    (e.g. "top_10.themes_summary"). _id and snapshot are never returned.
+    """
+    if fields is not None:
+        return {"_id": 0, **{f: 1 for f in normalize_fields(fields)}}
+    return {"_id": 0, "snapshot": 0, **{f: 0 for f in exclude}}
+
+
+def normalize_fields(fields: Iterable[str]) -> list[str]:
+    """
+    Validate and dedupe projection fields, sorted. Sub-paths of a requested
+    field are dropped ("top_10" covers "top_10.name"), since MongoDB rejects
+    projections with colliding paths. Raises ValueError for a malformed
+    field, one naming internal data (_id, snapshot), or no fields at all
+    (an empty inclusion projection would return every field).
+    """
+    wanted = set()
+    for field in fields:
+        field = field.strip()
+        if not _FIELD_PATTERN.fullmatch(field) or field.split(".")[0] in ("_id", "snapshot"):
+            raise ValueError(f"Invalid field '{field}'")
+        wanted.add(field)
+    if not wanted:
+        raise ValueError("No fields requested")
+    return sorted(f for f in wanted if f.split(".")[0] == f or f.split(".")[0] not in wanted)
+
+
 # ---------------------------------------------------------------------------
-# Categories CRUD
+# Categories CRUD (partitioned by city, versioned by snapshot)
 # ---------------------------------------------------------------------------
 
-def get_all_categories() -> list[dict[str, Any]]:
-    """Return all category documents, excluding MongoDB _id."""
+# Version of category documents that predate snapshots (sorts first)
+INITIAL_SNAPSHOT = "0"
+
+
+def get_all_categories(
+    city: str = DEFAULT_CITY,
+    fields: Iterable[str] | None = None,
+    exclude: Iterable[str] = (),
+) -> list[dict[str, Any]]:
+    """
+    Return all category documents of a city's active snapshot, excluding _id.
+
+    Pass `fields` to return only those fields, or `exclude` (e.g.
+    HEAVY_FIELDS) to leave some out.
+    """
     db = get_db()
-    docs = list(db.categories.find({}, {"_id": 0}))
+    version = get_active_snapshot(city)
+    if version is None:
+        return []
+    docs = list(db.categories.find(
+        {"city": city, "snapshot": version}, build_projection(fields, exclude),
+    ))
     return docs
 
 
-def get_category(name: str) -> dict[str, Any] | None:
-    """Return a single category document by name."""
+def iter_categories(
+    city: str = DEFAULT_CITY,
+    batch_size: int = 4,
+    fields: Iterable[str] | None = None,
+    exclude: Iterable[str] = (),
+) -> Iterator[dict[str, Any]]:
+    """
+    Stream the category documents of a city's active snapshot, ordered by
+    category (served from the (city, snapshot, category) index), fetching
+    `batch_size` documents per round trip. Only one batch is held in
+    memory at a time.
+    """
+    version = get_active_snapshot(city)
+    if version is None:
+        return
+    cursor = get_db().categories.find(
+        {"city": city, "snapshot": version}, build_projection(fields, exclude),
+    ).sort("category", ASCENDING).batch_size(batch_size)
+    with cursor:
+        yield from cursor
+
+
+def get_category(
+    name: str,
+    city: str = DEFAULT_CITY,
+    fields: Iterable[str] | None = None,
+    exclude: Iterable[str] = (),
+) -> dict[str, Any] | None:
+    """Return a single category document from a city's active snapshot."""
     db = get_db()
-    doc = db.categories.find_one({"category": name}, {"_id": 0})
+    version = get_active_snapshot(city)
+    if version is None:
+        return None
+    doc = db.categories.find_one(
+        {"city": city, "snapshot": version, "category": name},
+        build_projection(fields, exclude),
+    )
     return doc
 
 
 def upsert_category(data: dict[str, Any]) -> None:
-    """Insert or replace a category document (matched by category name)."""
+    """
+    Insert or replace a category document in its city's active snapshot
+    (creating the city's initial snapshot if it has none).
+    """
     db = get_db()
+    city = data.get("city", DEFAULT_CITY)
+    db.snapshots.update_one(
+        {"_id": city},
+        {"$setOnInsert": {"active": INITIAL_SNAPSHOT, "previous": None}},
+        upsert=True,
+    )
+    data = {**data, "city": city, "snapshot": get_active_snapshot(city)}
     db.categories.replace_one(
-        {"category": data["category"]},
+        {"city": city, "snapshot": data["snapshot"], "category": data["category"]},
         data,
         upsert=True,
     )
 
 
-def drop_all_categories() -> None:
-    """Remove all category documents (used before full refresh)."""
-    get_db().categories.delete_many({})
+def drop_all_categories(city: str | None = None) -> None:
+    """Remove all category documents and snapshot pointers, or only one city's."""
+    query = {} if city is None else {"city": city}
+    get_db().categories.delete_many(query)
+    get_db().snapshots.delete_many({} if city is None else {"_id": city})
+
+
+# ---------------------------------------------------------------------------
+# Category snapshots (staged writes + atomic publish)
+# ---------------------------------------------------------------------------
+
+def add_publish_listener(callback: Callable[[str], None]) -> None:
+    """Call `callback(city)` after every snapshot publish or rollback in this process."""
+    _publish_listeners.append(callback)
+
+
+def _notify_publish(city: str) -> None:
+    for callback in _publish_listeners:
+        try:
+            callback(city)
+        except Exception as e:
+            print(f"⚠️ Snapshot listener failed: {e}")
+
+
+def new_snapshot_version() -> str:
+    """A new snapshot version id; versions sort by creation time."""
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def get_active_snapshot(city: str = DEFAULT_CITY) -> str | None:
+    """Return the version readers currently see for a city."""
+    doc = get_db().snapshots.find_one({"_id": city}, {"active": 1})
+    return doc["active"] if doc else None
+
+
+def write_snapshot(version: str, docs: list[dict[str, Any]]) -> None:
+    """
+    Stage category documents (any mix of cities) under `version` in one
+    bulk_write. Readers don't see them until the version is published.
+    """
+    if not docs:
+        return
+    ops = []
+    for doc in docs:
+        doc = {"city": DEFAULT_CITY, **doc, "snapshot": version}
+        ops.append(ReplaceOne(
+            {"city": doc["city"], "snapshot": version, "category": doc["category"]},
+            doc,
+            upsert=True,
+        ))
+    get_db().categories.bulk_write(ops, ordered=False)
+
+
+def publish_snapshot(city: str, version: str, refreshed: set[str]) -> str | None:
+    """
+    Make staged `version` the active snapshot of `city` and return the
+    version it replaced.
+
+    Categories not in `refreshed` (not part of this run, or failed) are
+    first copied from the active snapshot, so the new version is complete.
+    The switch is a compare-and-set on the city's pointer document: if
+    another run published in the meantime, its categories are carried over
+    instead and the switch is retried, so concurrent shards never undo each
+    other's work.
+    """
+    db = get_db()
+    while True:
+        base = get_active_snapshot(city)
+        if base is not None:
+            carried = [
+                doc
+                for doc in db.categories.find({"city": city, "snapshot": base}, {"_id": 0})
+                if doc["category"] not in refreshed
+            ]
+            write_snapshot(version, carried)
+
+        pointer = {"active": version, "previous": base, "updated_at": datetime.now(timezone.utc)}
+        if base is None:
+            try:
+                db.snapshots.insert_one({"_id": city, **pointer})
+                _notify_publish(city)
+                return None
+            except DuplicateKeyError:
+                continue  # another run published this city's first snapshot
+        result = db.snapshots.update_one({"_id": city, "active": base}, {"$set": pointer})
+        if result.modified_count:
+            _notify_publish(city)
+            prune_snapshots(city, keep=(version, base))
+            return base
+
+
+def rollback_snapshot(city: str = DEFAULT_CITY) -> str:
+    """Switch a city back to its previous snapshot; returns that version."""
+    db = get_db()
+    doc = db.snapshots.find_one({"_id": city})
+    if not doc or not doc.get("previous"):
+        raise ValueError(f"No previous snapshot to roll back to for '{city}'")
+    result = db.snapshots.update_one(
+        {"_id": city, "active": doc["active"]},
+        {"$set": {
+            "active": doc["previous"],
+            "previous": doc["active"],
+            "updated_at": datetime.now(timezone.utc),
+        }},
+    )
+    if not result.modified_count:
+        raise RuntimeError(f"Snapshot of '{city}' changed during rollback; try again")
+    _notify_publish(city)
+    return doc["previous"]
+
+
+def prune_snapshots(city: str, keep: Iterable[str]) -> None:
+    """
+    Delete a city's category documents from versions older than every
+    version in `keep` (the new active and previous ones).
+
+    Concurrent runs can publish out of version order, so the kept versions
+    are excluded explicitly rather than by comparison. Versions newer than
+    the oldest kept one (another run may still be staging them) survive.
+    """
+    keep = list(keep)
+    get_db().categories.delete_many(
+        {"city": city, "snapshot": {"$lt": min(keep), "$nin": keep}},
+    )
+
+
+# ---------------------------------------------------------------------------
+# Place snapshots (incremental refresh)
+# ---------------------------------------------------------------------------
+
+def get_place_snapshots(place_ids: list[str]) -> dict[str, dict[str, Any]]:
+    """Return stored place snapshots for `place_ids`, keyed by place id."""
+    if not place_ids:
+        return {}
+    docs = get_db().places.find({"id": {"$in": place_ids}}, {"_id": 0})
+    return {doc["id"]: doc for doc in docs}
+
+
+def upsert_place_snapshots(places: list[dict[str, Any]]) -> None:
+    """Insert or replace place snapshots (matched by place id) in one batch."""
+    if not places:
+        return
+    get_db().places.bulk_write(
+        [ReplaceOne({"id": p["id"]}, p, upsert=True) for p in places],
+        ordered=False,
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -93,11 +400,12 @@ def log_refresh(status: str = "success", details: str = "") -> None:
     })
 
 
-def get_last_refresh() -> dict[str, Any] | None:
-    """Return the most recent refresh log entry."""
+def get_last_refresh(fields: Iterable[str] | None = None) -> dict[str, Any] | None:
+    """Return the most recent refresh log entry (only `fields`, if given)."""
+    projection = {"_id": 0, **{f: 1 for f in fields}} if fields is not None else {"_id": 0}
     doc = get_db().refresh_log.find_one(
         {},
-        {"_id": 0},
+        projection,
         sort=[("timestamp", -1)],
     )
     return doc
@@ -2,53 +2,223 @@
 Export MongoDB category data to a static JSON file for Vercel CDN serving.
 
 Usage:
-    python export_data.py
+    python export_data.py [--city SLUG] [--ndjson | --shards]
 
-Reads all categories from MongoDB and writes them to
-../tenmunches-frontend/public/data/categories.json
+Streams all categories from MongoDB to
+../tenmunches-frontend/public/data/categories.json (or, with --ndjson, one
+document per line to categories.ndjson). Documents are read from the
+cursor a batch at a time and encoded one by one, so memory use stays flat
+as the data grows, and files are written to a temp file and renamed into
+place, so a failed export never leaves a partial file behind.
+
+With --shards, writes one file per category instead, to
+../tenmunches-frontend/public/data/<city>/shards/, plus a small
+manifest.json next to that directory listing them. Shard names carry a
+hash of their content, so a shard that didn't change keeps its URL (and
+stays cached) across refreshes and isn't rewritten. Every shard gets
+precompressed .gz and .br (if brotli is installed) siblings.
 """
 
-import json
+import argparse
+import gzip
+import hashlib
 import os
+import re
 import sys
+from contextlib import contextmanager, suppress
+from typing import Any, BinaryIO, Iterator
 
+import orjson
 from dotenv import load_dotenv
 
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
 # Load env vars from backend .env, then from root .env as fallback
 load_dotenv()
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
 
-from db import get_all_categories
+from cities import DEFAULT_CITY
+from db import iter_categories
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "tenmunches-frontend", "public", "data")
+
+# Category documents fetched per cursor round trip
+EXPORT_BATCH_SIZE = 4
 
+# Hex digits of the content hash in shard file names
+SHARD_HASH_LENGTH = 12
 
-def export_categories(output_path: str | None = None) -> None:
-    """Export all category data from MongoDB to a static JSON file."""
+
+def export_categories(
+    output_path: str | None = None,
+    city: str = DEFAULT_CITY,
+    ndjson: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> int:
+    """
+    Stream a city's category data from MongoDB to a static JSON array (or
+    NDJSON) file and return the number of categories written.
+    """
     if output_path is None:
-        output_path = os.path.join(
-            os.path.dirname(__file__),
-            "..",
-            "tenmunches-frontend",
-            "public",
-            "data",
-            "categories.json",
-        )
+        output_path = os.path.join(DATA_DIR, "categories.ndjson" if ndjson else "categories.json")
 
     print("📦 Exporting categories from MongoDB...")
-    data = get_all_categories()
-
-    if not data:
-        print("❌ No data found in MongoDB. Run refresh.py first.")
-        sys.exit(1)
 
     # Ensure output directory exists
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    count = 0
+    with _atomic_open(output_path) as f:
+        if not ndjson:
+            f.write(b"[")
+        for doc in iter_categories(city, batch_size=batch_size):
+            if ndjson:
+                f.write(orjson.dumps(doc, option=orjson.OPT_APPEND_NEWLINE))
+            else:
+                f.write(b"," + orjson.dumps(doc) if count else orjson.dumps(doc))
+            count += 1
+        if not count:
+            print("❌ No data found in MongoDB. Run refresh.py first.")
+            sys.exit(1)  # the previous file is left in place
+        if not ndjson:
+            f.write(b"]")
 
     size_kb = os.path.getsize(output_path) / 1024
-    print(f"✅ Exported {len(data)} categories to {output_path} ({size_kb:.1f} KB)")
+    print(f"✅ Exported {count} categories to {output_path} ({size_kb:.1f} KB)")
+    return count
+
+
+def export_shards(output_dir: str | None = None, city: str = DEFAULT_CITY) -> dict[str, Any]:
+    """
+    Export a city's categories as content-hashed per-category shards plus
+    a manifest, and return the manifest.
+
+    Shards already on disk under the same name are left alone. Shards
+    referenced by neither the new nor the previous manifest are deleted
+    (clients holding the previous manifest can still fetch its shards).
+    """
+    if output_dir is None:
+        output_dir = os.path.join(DATA_DIR, city)
+    shard_dir = os.path.join(output_dir, "shards")
+    manifest_path = os.path.join(output_dir, "manifest.json")
+
+    print("📦 Exporting category shards from MongoDB...")
+    os.makedirs(shard_dir, exist_ok=True)
+    entries = []
+    written = 0
+    for doc in iter_categories(city, batch_size=EXPORT_BATCH_SIZE):
+        body = orjson.dumps(doc)
+        digest = hashlib.sha256(body).hexdigest()[:SHARD_HASH_LENGTH]
+        name = f"{_slug(doc['category'])}.{digest}.json"
+        if _write_shard(os.path.join(shard_dir, name), body):
+            written += 1
+        entries.append({
+            "category": doc["category"],
+            "file": f"shards/{name}",
+            "hash": digest,
+            "bytes": len(body),
+        })
+    if not entries:
+        print("❌ No data found in MongoDB. Run refresh.py first.")
+        sys.exit(1)
+    manifest = {"city": city, "categories": entries}
+
+    previous = _read_manifest(manifest_path)
+    keep = {os.path.basename(e["file"]) for e in entries + previous.get("categories", [])}
+    removed = _prune(shard_dir, keep)
+    if manifest != previous:
+        _write_atomic(manifest_path, orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
+
+    print(
+        f"✅ Exported {len(entries)} shards to {output_dir} "
+        f"({written} written, {len(entries) - written} unchanged, {removed} removed)"
+    )
+    return manifest
+
+
+def _slug(category: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", category.lower()).strip("-")
+
+
+def _variants(body: bytes) -> dict[str, bytes]:
+    """The file contents to write for a shard, keyed by file suffix."""
+    variants = {"": body, ".gz": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(body, quality=11)
+    return variants
+
+
+def _write_shard(path: str, body: bytes) -> bool:
+    """Write a shard and its compressed siblings unless all exist. Returns True if written."""
+    suffixes = ["", ".gz"] + ([".br"] if brotli is not None else [])
+    if all(os.path.exists(path + suffix) for suffix in suffixes):
+        return False  # same name, same content
+    for suffix, content in _variants(body).items():
+        _write_atomic(path + suffix, content)
+    return True
+
+
+@contextmanager
+def _atomic_open(path: str) -> Iterator[BinaryIO]:
+    """
+    Open a temp file next to `path` for writing. It replaces `path` when
+    the block exits normally and is deleted if it raises, so readers only
+    ever see the old or the complete new file.
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_atomic(path: str, content: bytes) -> None:
+    with _atomic_open(path) as f:
+        f.write(content)
+
+
+def _read_manifest(path: str) -> dict[str, Any]:
+    try:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return {}
+
+
+def _prune(shard_dir: str, keep: set[str]) -> int:
+    """Delete shard files (and leftovers) not in `keep`. Returns the number of shards removed."""
+    removed = 0
+    for name in os.listdir(shard_dir):
+        base = name.removesuffix(".gz").removesuffix(".br")
+        if name.endswith(".tmp") or base not in keep:
+            os.remove(os.path.join(shard_dir, name))
+            removed += name.endswith(".json")
+    return removed
 
 
 if __name__ == "__main__":
-    export_categories()
+    parser = argparse.ArgumentParser(description="Export category data to static JSON")
+    parser.add_argument("--city", default=DEFAULT_CITY, help="city slug to export")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--ndjson",
+        action="store_true",
+        help="write newline-delimited JSON (one category per line)",
+    )
+    mode.add_argument(
+        "--shards",
+        action="store_true",
+        help="write content-hashed per-category shards and a manifest",
+    )
+    args = parser.parse_args()
+    if args.shards:
+        export_shards(city=args.city)
+    else:
+        export_categories(city=args.city, ndjson=args.ndjson)
@@ -3,24 +3,61 @@ Gemini AI review summarizer for TenMunches.
 
 Takes a list of reviews for a business and generates a concise,
 insightful 2-3 sentence summary highlighting what makes the place special.
+
+`summarize_places` packs up to GEMINI_BATCH_SIZE places into one prompt
+and asks for a JSON array of per-place summaries. Every call first takes
+from two shared token buckets, one for requests per minute (GEMINI_RPM)
+and one for estimated tokens per minute (GEMINI_TPM), so concurrent
+category workers stay under the quota together. Rate-limited and
+transient failures are retried with jittered exponential backoff, or
+after the delay the server asks for when it gives one.
 """
 
+import json
 import os
+import random
+import re
 import time
 from typing import Any
 
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
 
+from rate_limit import TokenBucket
+
+try:
+    from google import genai
+    from google.genai import types
+except ImportError:  # optional dependency
+    genai = None
+    types = None
+
 load_dotenv()
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+
+# Places per request, and the quota shared by every caller in this process
+BATCH_SIZE = int(os.getenv("GEMINI_BATCH_SIZE", "10"))
+REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_RPM", "15"))
+TOKENS_PER_MINUTE = float(os.getenv("GEMINI_TPM", "1000000"))
+
+# Reviews per place sent to the model (fewer tokens, faster responses)
+MAX_REVIEWS = 10
+# Output token budget per place in a batch
+OUTPUT_TOKENS_PER_PLACE = 80
+
+# Status codes worth retrying (rate limiting and transient server errors)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 2.0  # seconds
+BACKOFF_CAP = 60.0  # also the longest server retry hint worth waiting for
+
+_request_limiter = TokenBucket(REQUESTS_PER_MINUTE / 60)
+_token_limiter = TokenBucket(TOKENS_PER_MINUTE / 60, capacity=TOKENS_PER_MINUTE)
 
 # Initialize Gemini client
 client = None
-if GEMINI_API_KEY:
+if GEMINI_API_KEY and genai is not None:
     try:
         # The new SDK auto-detects GOOGLE_API_KEY from env, which we use for Places API.
         # It complains if both are set, or uses the wrong one. Unset it locally for the client init.
@@ -37,12 +74,67 @@ if GEMINI_API_KEY:
     except Exception as e:
         print(f"  ⚠️  Failed to initialize Gemini client: {e}")
 
-SUMMARY_PROMPT = """You are a food critic. Based on these customer reviews for "{name}" ({category} in San Francisco), write ONE sentence (under 30 words) describing what this place is specifically known for — mention a signature dish, drink, or standout quality. Be specific and vivid. No generic praise.
+BATCH_PROMPT = """You are a food critic. For each {category} place in {city} below, write ONE sentence (under 30 words) describing what it is specifically known for, based on its customer reviews — mention a signature dish, drink, or standout quality. Be specific and vivid. No generic praise.
+
+Return a JSON array with one {{"id": ..., "summary": ...}} object per place, using the ids given.
+
+{places}"""
+
+PLACE_BLOCK = """=== id: {id} | {name} ===
+{reviews}"""
 
-Reviews:
-{reviews}
+RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"id": {"type": "STRING"}, "summary": {"type": "STRING"}},
+        "required": ["id", "summary"],
+    },
+}
 
-One-sentence summary:"""
+
+def summarize_places(
+    places: list[dict[str, Any]],
+    category: str,
+    city: str = "San Francisco",
+    batch_size: int = BATCH_SIZE,
+    max_retries: int = 5,
+) -> dict[str, str]:
+    """
+    Generate AI summaries for many places, `batch_size` per Gemini call.
+
+    Each place needs "id", "name" and "reviews". Returns summaries keyed by
+    place id; places without reviews, or whose batch failed, are left out.
+    """
+    if not client:
+        print("  ⚠️  Gemini client not initialized, skipping AI summaries")
+        return {}
+
+    blocks = {}
+    for place in places:
+        reviews = _reviews_block(place.get("reviews", []))
+        if reviews:
+            blocks[place["id"]] = PLACE_BLOCK.format(id=place["id"], name=place["name"], reviews=reviews)
+
+    summaries: dict[str, str] = {}
+    ids = list(blocks)
+    for i in range(0, len(ids), max(batch_size, 1)):
+        batch = ids[i:i + max(batch_size, 1)]
+        prompt = BATCH_PROMPT.format(
+            category=category,
+            city=city,
+            places="\n\n".join(blocks[pid] for pid in batch),
+        )
+        result = _generate_with_retry(prompt, len(batch), category, max_retries)
+        if result is None:
+            continue
+        for pid, summary in result.items():
+            if pid in blocks and summary:
+                summaries[pid] = _clean(summary)
+        missing = [pid for pid in batch if pid not in summaries]
+        if missing:
+            print(f"  ⚠️  Gemini returned no summary for {len(missing)} {category} places")
+    return summaries
 
 
 def summarize_reviews(
@@ -50,61 +142,132 @@ def summarize_reviews(
     category: str,
     reviews: list[dict[str, Any]],
     max_retries: int = 5,
+    city: str = "San Francisco",
 ) -> str:
-    """
-    Generate an AI summary of reviews using Gemini.
-    Handles rate limiting (429) via exponential backoff.
-    """
-    if not client:
-        print("  ⚠️  Gemini client not initialized, skipping AI summary")
-        return ""
+    """Generate an AI summary of one business's reviews using Gemini."""
+    place = {"id": "0", "name": name, "reviews": reviews}
+    return summarize_places([place], category, city, max_retries=max_retries).get("0", "")
 
-    if not reviews:
-        return ""
 
-    # Build review text block (limit to 10 reviews for faster processing/fewer tokens)
+def _reviews_block(reviews: list[dict[str, Any]]) -> str:
     review_texts = []
-    for r in reviews[:10]:
+    for r in reviews[:MAX_REVIEWS]:
         text = r.get("text", "").strip()
         rating = r.get("rating", "")
         if text:
             prefix = f"[{rating}★] " if rating else ""
             review_texts.append(f"{prefix}{text}")
+    return "\n---\n".join(review_texts)
+
 
-    if not review_texts:
-        return ""
+def _clean(summary: str) -> str:
+    summary = summary.strip()
+    # Remove any surrounding quotes if the model adds them
+    if summary.startswith('"') and summary.endswith('"'):
+        summary = summary[1:-1]
+    return summary
 
-    reviews_block = "\n---\n".join(review_texts)
-    prompt = SUMMARY_PROMPT.format(
-        name=name,
-        category=category,
-        reviews=reviews_block,
+
+def _generate(prompt: str, max_output_tokens: int) -> str:
+    """One Gemini call returning the raw JSON response text."""
+    response = client.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=prompt,
+        config=types.GenerateContentConfig(
+            temperature=0.7,
+            max_output_tokens=max_output_tokens,
+            response_mime_type="application/json",
+            response_schema=RESPONSE_SCHEMA,
+        ),
     )
+    return response.text
+
 
+def _generate_with_retry(
+    prompt: str,
+    count: int,
+    category: str,
+    max_retries: int,
+) -> dict[str, str] | None:
+    """Call Gemini for one batch under the rate limits, retrying transient failures."""
+    max_output_tokens = OUTPUT_TOKENS_PER_PLACE * count
+    # ~4 characters per token for English text
+    estimated_tokens = len(prompt) / 4 + max_output_tokens
     for attempt in range(max_retries):
+        _request_limiter.acquire()
+        _token_limiter.acquire(estimated_tokens)
         try:
-            response = client.models.generate_content(
-                model='gemini-2.0-flash',
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    temperature=0.7,
-                    max_output_tokens=300,
-                ),
-            )
-            summary = response.text.strip()
-            # Remove any surrounding quotes if the model adds them
-            if summary.startswith('"') and summary.endswith('"'):
-                summary = summary[1:-1]
-            return summary
+            text = _generate(prompt, max_output_tokens)
+            return {str(item["id"]): str(item["summary"]) for item in json.loads(text)}
+        except (ValueError, TypeError, KeyError) as e:
+            # Malformed or truncated JSON: the next sample is usually fine
+            delay = _backoff(attempt)
+            print(f"  ⚠️  Unparseable Gemini response for {category} ({e}). Retrying in {delay:.1f}s...")
         except Exception as e:
-            error_str = str(e)
-            if "429" in error_str or "Quota exceeded" in error_str:
-                wait_time = 35 * (attempt + 1)
-                print(f"  ⏳ Gemini rate limit hit for {name}. Retrying in {wait_time}s... (Attempt {attempt + 1}/{max_retries})")
-                time.sleep(wait_time)
-            else:
-                print(f"  ⚠️  Gemini summarization failed for {name}: {e}")
-                break
-
-    print(f"  ❌ Failed to generate AI summary for {name} after {max_retries} attempts.")
-    return ""
+            if _status(e) not in RETRY_STATUSES:
+                print(f"  ⚠️  Gemini summarization failed for {category}: {e}")
+                return None
+            hint = _retry_hint(e)
+            if hint is not None and hint > BACKOFF_CAP:
+                # e.g. a daily quota: waiting it out would stall the refresh
+                print(f"  ⚠️  Gemini asked to retry {category} in {hint:.0f}s. Giving up.")
+                return None
+            delay = hint + random.uniform(0, BACKOFF_BASE) if hint is not None else _backoff(attempt)
+            print(
+                f"  ⏳ Gemini error {_status(e)} for {category}. Retrying in {delay:.1f}s... "
+                f"(Attempt {attempt + 1}/{max_retries})"
+            )
+        if attempt + 1 < max_retries:
+            time.sleep(delay)
+
+    print(f"  ❌ Failed to generate AI summaries for {category} after {max_retries} attempts.")
+    return None
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def _status(error: Exception) -> int | None:
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    if "429" in str(error) or "Quota exceeded" in str(error):
+        return 429
+    return None
+
+
+def _retry_hint(error: Exception) -> float | None:
+    """
+    The delay the server asked for, in seconds: a RetryInfo "retryDelay"
+    in the error details, a Retry-After header, or "retry in Ns" in the
+    message.
+    """
+    delay = _find_retry_delay(getattr(error, "details", None))
+    if delay is not None:
+        return delay
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", ""))
+    except (TypeError, ValueError):
+        pass
+    match = re.search(r"retry in ([\d.]+)\s*s", str(error), re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+
+def _find_retry_delay(details: Any) -> float | None:
+    if isinstance(details, dict):
+        value = details.get("retryDelay")
+        if isinstance(value, str) and value.endswith("s"):
+            try:
+                return float(value[:-1])
+            except ValueError:
+                pass
+        details = list(details.values())
+    if isinstance(details, list):
+        for item in details:
+            delay = _find_retry_delay(item)
+            if delay is not None:
+                return delay
+    return None
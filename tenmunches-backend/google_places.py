@@ -2,15 +2,21 @@
 Google Places API (v1) client for TenMunches.
 
 Fetches businesses, reviews, and photo URLs from the Google Places API.
+Responses can be cached on disk (and replayed offline) via places_cache.
 """
 
+import asyncio
+import math
 import os
 import time
-from typing import Any
+from typing import Any, AsyncIterator, Iterator
 
+import httpx
 import requests
 from dotenv import load_dotenv
 
+from places_cache import ResponseCache
+
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
@@ -18,6 +24,31 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
 TEXT_SEARCH_URL = "https://places.googleapis.com/v1/places:searchText"
 DETAILS_URL = "https://places.googleapis.com/v1/places/"
 
+SEARCH_FIELDS = (
+    "places.displayName,places.id,places.rating,"
+    "places.userRatingCount,places.formattedAddress,"
+    "places.types,places.photos,nextPageToken"
+)
+DETAILS_FIELDS = (
+    "id,displayName,rating,userRatingCount,formattedAddress,"
+    "types,reviews,photos,googleMapsUri"
+)
+
+# Place types that describe nearly every result; left out of "categories"
+GENERIC_TYPES = {"point_of_interest", "establishment", "food", "store"}
+MAX_TYPES = 5
+
+# Text search returns at most 20 places per page (and 60 across all pages)
+PAGE_SIZE = 20
+
+# Status codes worth retrying (rate limiting and transient server errors)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Longest Retry-After honored (seconds); larger values are clamped to it
+MAX_RETRY_AFTER = 30.0
+
+# Shared on-disk response cache (disabled unless PLACES_CACHE_MODE is set)
+response_cache = ResponseCache.from_env()
+
 
 def _headers(extra_fields: str = "") -> dict[str, str]:
     """Build standard headers for Google Places API requests."""
@@ -34,70 +65,321 @@ def search_places(
 ) -> list[dict[str, Any]]:
     """
     Search Google Places for businesses by text query.
-    Returns raw place objects from the API.
+    Returns raw place objects from the API (all pages, up to `max_results`).
     """
-    if not GOOGLE_API_KEY:
-        raise ValueError("GOOGLE_API_KEY not set in environment")
+    return [p for page in iter_search_pages(query, location, max_results) for p in page]
 
-    headers = _headers(
-        "places.displayName,places.id,places.rating,"
-        "places.userRatingCount,places.formattedAddress,"
-        "places.types,places.photos"
-    )
-    data = {
+
+def iter_search_pages(
+    query: str,
+    location: str = "San Francisco",
+    max_results: int = 60,
+) -> Iterator[list[dict[str, Any]]]:
+    """
+    Yield pages of text-search results as they arrive, following
+    `nextPageToken` until `max_results` places have been returned.
+    """
+    remaining = max_results
+    token = ""
+    while remaining > 0:
+        data = _search_body(query, location, remaining, token)
+        result = _search_page(data)
+        places = result.get("places", [])[:remaining]
+        if places:
+            yield places
+        remaining -= len(places)
+        token = result.get("nextPageToken", "")
+        if not token or not places:
+            return
+
+
+def _search_body(query: str, location: str, remaining: int, token: str) -> dict[str, Any]:
+    """Build the searchText request body for one page."""
+    data: dict[str, Any] = {
         "textQuery": f"{query} in {location}",
-        "maxResultCount": min(max_results, 20),  # API max per request is 20
+        "pageSize": min(remaining, PAGE_SIZE),
     }
+    if token:
+        data["pageToken"] = token
+    return data
+
+
+def _search_page(data: dict[str, Any]) -> dict[str, Any]:
+    """Fetch one page of text-search results. Returns {} on failure."""
+    cached = _from_cache("search", "POST", TEXT_SEARCH_URL, SEARCH_FIELDS, data)
+    if cached is not None:
+        return cached
+
+    if not GOOGLE_API_KEY:
+        raise ValueError("GOOGLE_API_KEY not set in environment")
+
+    headers = _headers(SEARCH_FIELDS)
 
     try:
         resp = requests.post(TEXT_SEARCH_URL, headers=headers, json=data, timeout=10)
         if not resp.ok:
             _log_error("search_places", resp)
-            return []
+            return {}
         result = resp.json()
-        return result.get("places", [])[:max_results]
+        response_cache.put("search", "POST", TEXT_SEARCH_URL, SEARCH_FIELDS, data, result)
+        return result
     except requests.RequestException as e:
         print(f"❌ search_places error: {e}")
-        return []
+        return {}
 
 
 def get_place_details(place_id: str) -> dict[str, Any]:
     """
     Get detailed info (reviews, photos) for a single place.
     """
-    headers = _headers(
-        "id,displayName,rating,userRatingCount,formattedAddress,"
-        "types,reviews,photos,googleMapsUri"
-    )
+    url = f"{DETAILS_URL}{place_id}"
+    cached = _from_cache("details", "GET", url, DETAILS_FIELDS)
+    if cached is not None:
+        return cached
+
+    headers = _headers(DETAILS_FIELDS)
 
     try:
-        resp = requests.get(
-            f"{DETAILS_URL}{place_id}",
-            headers=headers,
-            timeout=10,
-        )
+        resp = requests.get(url, headers=headers, timeout=10)
         if not resp.ok:
             _log_error("get_place_details", resp)
             return {}
-        return resp.json()
+        result = resp.json()
+        response_cache.put("details", "GET", url, DETAILS_FIELDS, None, result)
+        return result
     except requests.RequestException as e:
         print(f"❌ get_place_details error: {e}")
         return {}
 
 
-def build_photo_url(place: dict[str, Any]) -> str:
+class AsyncPlacesClient:
     """
-    Build a Google Places photo URL from the first photo reference.
-    Returns the direct media URL (requires API key).
+    asyncio-native Places client backed by one pooled HTTP/2 connection.
+
+    Use as an async context manager (or call `aclose()`). Concurrent calls
+    share the pool and are capped at `max_concurrency` in-flight requests.
+    Rate-limited (429) and transient 5xx responses, timeouts and connection
+    errors are retried with exponential backoff, honouring `Retry-After`.
+    Failures are logged and return empty results, like the sync functions.
+    Responses go through `cache` (the shared on-disk cache by default).
+
+    With `memoize_details`, each place's details are fetched at most once per
+    client: concurrent and repeated requests for the same id (e.g. a place
+    found by two overlapping queries) share one result. Failed fetches are
+    forgotten so a later call can retry them.
     """
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        max_concurrency: int = 8,
+        timeout: float = 10.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        transport: httpx.AsyncBaseTransport | None = None,
+        cache: ResponseCache | None = None,
+        memoize_details: bool = False,
+    ) -> None:
+        self.api_key = api_key if api_key is not None else GOOGLE_API_KEY
+        self.cache = cache if cache is not None else response_cache
+        if not self.api_key and not self.cache.replay:
+            raise ValueError("GOOGLE_API_KEY not set in environment")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.memoize_details = memoize_details
+        self._details: dict[str, asyncio.Future[dict[str, Any]]] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._http = httpx.AsyncClient(
+            http2=True,
+            headers={"X-Goog-Api-Key": self.api_key},
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+            ),
+            timeout=timeout,
+            transport=transport,
+        )
+
+    async def __aenter__(self) -> "AsyncPlacesClient":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the underlying connection pool."""
+        await self._http.aclose()
+
+    async def search_places(
+        self,
+        query: str,
+        location: str = "San Francisco",
+        max_results: int = 60,
+        timeout: float | None = None,
+    ) -> list[dict[str, Any]]:
+        """Async equivalent of `search_places`."""
+        return [
+            p
+            async for page in self.iter_search_pages(query, location, max_results, timeout)
+            for p in page
+        ]
+
+    async def iter_search_pages(
+        self,
+        query: str,
+        location: str = "San Francisco",
+        max_results: int = 60,
+        timeout: float | None = None,
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        """Async equivalent of `iter_search_pages`."""
+        remaining = max_results
+        token = ""
+        while remaining > 0:
+            result = await self._request(
+                "POST", TEXT_SEARCH_URL, SEARCH_FIELDS, "search",
+                json=_search_body(query, location, remaining, token), timeout=timeout,
+            )
+            places = result.get("places", [])[:remaining]
+            if places:
+                yield places
+            remaining -= len(places)
+            token = result.get("nextPageToken", "")
+            if not token or not places:
+                return
+
+    async def get_place_details(
+        self,
+        place_id: str,
+        timeout: float | None = None,
+    ) -> dict[str, Any]:
+        """Async equivalent of `get_place_details`."""
+        if not self.memoize_details:
+            return await self._fetch_details(place_id, timeout)
+
+        future = self._details.get(place_id)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch_details(place_id, timeout))
+            self._details[place_id] = future
+            future.add_done_callback(lambda f: self._forget_failed(place_id, f))
+        return await asyncio.shield(future)
+
+    def _forget_failed(self, place_id: str, future: asyncio.Future) -> None:
+        if future.cancelled() or future.exception() is not None or not future.result():
+            self._details.pop(place_id, None)
+
+    async def _fetch_details(
+        self,
+        place_id: str,
+        timeout: float | None = None,
+    ) -> dict[str, Any]:
+        return await self._request(
+            "GET", f"{DETAILS_URL}{place_id}", DETAILS_FIELDS, "details",
+            timeout=timeout,
+        )
+
+    async def get_many_details(
+        self,
+        place_ids: list[str],
+        timeout: float | None = None,
+    ) -> list[dict[str, Any]]:
+        """Fetch details for many places concurrently, preserving order."""
+        return list(await asyncio.gather(
+            *(self.get_place_details(pid, timeout=timeout) for pid in place_ids)
+        ))
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        field_mask: str,
+        endpoint: str,
+        json: dict[str, Any] | None = None,
+        timeout: float | None = None,
+    ) -> dict[str, Any]:
+        """Send one request with retries. Returns the JSON body, or {} on failure."""
+        cached = _from_cache(endpoint, method, url, field_mask, json, self.cache)
+        if cached is not None:
+            return cached
+
+        context = "search_places" if endpoint == "search" else "get_place_details"
+        headers = {"X-Goog-FieldMask": field_mask}
+        timeout = timeout if timeout is not None else self.timeout
+
+        for attempt in range(self.max_retries + 1):
+            delay = self.backoff * (2 ** attempt)
+            try:
+                async with self._semaphore:
+                    resp = await self._http.request(
+                        method, url, headers=headers, json=json, timeout=timeout,
+                    )
+                if resp.is_success:
+                    result = resp.json()
+                    self.cache.put(endpoint, method, url, field_mask, json, result)
+                    return result
+                if resp.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    _log_error(context, resp)
+                    return {}
+                delay = _retry_after(resp, delay)
+            except httpx.HTTPError as e:
+                if attempt == self.max_retries:
+                    print(f"❌ {context} error: {e}")
+                    return {}
+            await asyncio.sleep(delay)
+        return {}
+
+
+def _from_cache(
+    endpoint: str,
+    method: str,
+    url: str,
+    field_mask: str,
+    body: dict[str, Any] | None = None,
+    cache: ResponseCache | None = None,
+) -> dict[str, Any] | None:
+    """
+    Look a request up in the response cache.
+
+    In replay mode a miss returns {} (an empty response) instead of None,
+    so callers never fall through to the network.
+    """
+    cache = cache or response_cache
+    hit = cache.get(endpoint, method, url, field_mask, body)
+    if hit is None and cache.replay:
+        print(f"⚠️  Places cache replay miss: {method} {url}")
+        return {}
+    return hit
+
+
+def _retry_after(resp: httpx.Response, default: float) -> float:
+    """Return the server's Retry-After delay in seconds (capped), if it sent one."""
+    try:
+        delay = float(resp.headers.get("Retry-After", ""))
+    except ValueError:
+        return default
+    if math.isnan(delay):
+        return default
+    return min(max(delay, 0.0), MAX_RETRY_AFTER)
+
+
+def photo_name(place: dict[str, Any]) -> str:
+    """Resource name of a place's first photo ("" if it has none)."""
     photos = place.get("photos", [])
     if not photos:
         return ""
-    photo_name = photos[0].get("name", "")
-    if not photo_name:
+    return photos[0].get("name", "")
+
+
+def build_photo_url(place: dict[str, Any]) -> str:
+    """
+    Build a Google Places photo URL from the first photo reference.
+    Returns the direct media URL (requires API key).
+    """
+    name = photo_name(place)
+    if not name:
         return ""
     return (
-        f"https://places.googleapis.com/v1/{photo_name}/media"
+        f"https://places.googleapis.com/v1/{name}/media"
         f"?key={GOOGLE_API_KEY}&maxWidthPx=800"
     )
 
@@ -115,7 +397,7 @@ def simplify_place(
         "rating": place.get("rating", 0),
         "review_count": place.get("userRatingCount", 0),
         "address": place.get("formattedAddress", ""),
-        "categories": place.get("types", []),
+        "categories": [t for t in place.get("types", []) if t not in GENERIC_TYPES][:MAX_TYPES],
         "url": place.get("googleMapsUri", ""),
         "photo_url": build_photo_url(place),
         "reviews": [
@@ -136,7 +418,7 @@ def simplify_place(
     }
 
 
-def _log_error(context: str, resp: requests.Response) -> None:
+def _log_error(context: str, resp: requests.Response | httpx.Response) -> None:
     """Log an API error with as much detail as possible."""
     body = resp.text
     try:
@@ -0,0 +1,136 @@
+"""
+Multi-process NLP stage for the TenMunches refresh pipeline.
+
+TextBlob-style scoring is pure Python and holds the GIL, so threads don't
+help; this stage spreads review enrichment (sentiment + themes) over a
+process pool instead.
+
+The sentiment lexicon and the compiled theme matcher are loaded once in the
+parent before the workers are forked, and the heap is frozen (gc.freeze) so
+the workers share those read-only pages instead of copying them. Forking
+is only safe while the parent is single-threaded (as in a standalone
+refresh): inside the API server, where refreshes run on a job thread next
+to Motor and the scheduler, or on platforms without fork, workers are
+started with forkserver/spawn and load the tables in their initializer.
+
+Reviews are flattened across places, scored in fixed-size chunks, and
+reassembled so results come back in their original order. With a
+ReviewMemo, reviews scored in an earlier run are looked up in the parent
+and only new review texts are sent to the workers.
+"""
+
+import gc
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+from polarity import load_lexicon
+from review_memo import ReviewMemo
+from sentiment import apply_scores, process_reviews
+
+# Reviews per task sent to a worker
+CHUNK_SIZE = 200
+
+
+def _init_worker() -> None:
+    """Load shared tables (a no-op when they were inherited through fork)."""
+    load_lexicon()
+
+
+def _ready() -> int:
+    return os.getpid()
+
+
+def _start_method() -> str:
+    """fork while this process has a single thread, else forkserver/spawn."""
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods and threading.active_count() == 1:
+        return "fork"
+    return "forkserver" if "forkserver" in methods else "spawn"
+
+
+class NLPStage:
+    """
+    Enrich lists of reviews on `workers` processes (inline when workers <= 1).
+
+    Worker processes are started eagerly on construction. Created before
+    any other thread starts, they are forked and share the parent's
+    tables; otherwise they are started fresh (see _start_method).
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        chunk_size: int = CHUNK_SIZE,
+        memo: ReviewMemo | None = None,
+    ) -> None:
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.memo = memo  # only ever used from the parent process
+        self._pool: ProcessPoolExecutor | None = None
+        self.start_method: str | None = None  # None: inline
+        self._frozen = False
+        if workers <= 1:
+            return
+
+        self.start_method = _start_method()
+        if self.start_method == "fork":
+            load_lexicon()
+            gc.freeze()  # keep shared pages out of the collector's reach
+            self._frozen = True
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_init_worker,
+        )
+        self._pool.submit(_ready).result()  # start every worker now
+
+    def __enter__(self) -> "NLPStage":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def process(self, review_lists: list[list[dict[str, Any]]]) -> list[list[dict[str, Any]]]:
+        """Enrich every review list, preserving list and review order."""
+        flat = [r for reviews in review_lists for r in reviews]
+        texts = [r.get("text", "") for r in flat]
+        known = self.memo.get_many(list(set(texts))) if self.memo is not None else {}
+
+        misses = [r for r, text in zip(flat, texts) if text not in known]
+        scored = iter(self._score(misses))
+        enriched = [
+            apply_scores(r, *known[text]) if text in known else next(scored)
+            for r, text in zip(flat, texts)
+        ]
+        if self.memo is not None and misses:
+            self.memo.put_many({
+                r.get("text", ""): (r["sentiment"], r["theme_counts"])
+                for r in enriched
+                if r.get("text", "") not in known
+            })
+
+        results: list[list[dict[str, Any]]] = []
+        offset = 0
+        for reviews in review_lists:
+            results.append(enriched[offset:offset + len(reviews)])
+            offset += len(reviews)
+        return results
+
+    def _score(self, reviews: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Run process_reviews over `reviews` (chunked on the pool, if any)."""
+        if self._pool is None or not reviews:
+            return process_reviews(reviews)
+        chunks = [reviews[i:i + self.chunk_size] for i in range(0, len(reviews), self.chunk_size)]
+        return [r for chunk in self._pool.map(process_reviews, chunks) for r in chunk]
+
+    def close(self) -> None:
+        """Shut the worker pool down."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        if self._frozen:
+            gc.unfreeze()
+            self._frozen = False
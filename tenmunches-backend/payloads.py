@@ -0,0 +1,89 @@
+"""
+Pre-encoded JSON responses for the TenMunches API.
+
+An EncodedPayload is built once per cached value: the JSON body is
+serialized with orjson, gets a strong ETag (SHA-256 of the body) and
+gzip/brotli variants compressed up front. Serving it from the cache is
+then a header check plus a bytes copy: a matching If-None-Match gets an
+empty 304, otherwise the best encoding the client accepts is returned.
+
+Payloads are built on request (on a cache miss), so they use moderate
+compression levels; building one still takes CPU time, so the server
+does it off the event loop. The static export (export_data.py) compresses
+at the maximum levels instead.
+
+Brotli is optional; without the `brotli` package only gzip is offered.
+"""
+
+import gzip
+import hashlib
+from typing import Any
+
+import orjson
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Bodies smaller than this aren't worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+# Compression levels for on-the-fly responses: most of the size win of the
+# maximum levels at a fraction of the CPU time
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+
+
+class EncodedPayload:
+    """A JSON body with its ETag and precompressed variants."""
+
+    def __init__(self, data: Any) -> None:
+        self.body = orjson.dumps(data)
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.variants: dict[str, bytes] = {}
+        if len(self.body) >= MIN_COMPRESS_BYTES:
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(self.body, quality=BROTLI_QUALITY)
+            self.variants["gzip"] = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+
+    def response(self, request: Request) -> Response:
+        """Return a 304 for a matching If-None-Match, else the best encoding."""
+        headers = {"ETag": self.etag, "Vary": "Accept-Encoding"}
+        if _etag_matches(request.headers.get("if-none-match", ""), self.etag):
+            return Response(status_code=304, headers=headers)
+
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in accepted:
+                headers["Content-Encoding"] = encoding
+                return Response(self.variants[encoding], media_type="application/json", headers=headers)
+        return Response(self.body, media_type="application/json", headers=headers)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    candidates = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return etag in candidates
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    """Content codings the client accepts (q=0 excluded)."""
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
@@ -0,0 +1,82 @@
+"""
+Local index of uploaded place photos for TenMunches.
+
+Maps each place_id to the Google photo resource name its Cloudinary image
+was uploaded from, and to the resulting CDN URL. The refresh pipeline
+resolves places whose photo reference is unchanged straight from the
+index, with no Cloudinary call. Only new places and places whose photo
+reference changed are uploaded.
+
+The index is a small JSON file kept in output/ next to the category data,
+so the weekly workflow commits it along with the export.
+"""
+
+import json
+import os
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "output", "photo_index.json")
+
+
+class PhotoIndex:
+    """Thread-safe place_id -> {"photo": name, "url": cdn_url} mapping."""
+
+    def __init__(self, path: str = DEFAULT_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(path, encoding="utf-8") as f:
+                self._entries: dict[str, dict[str, str]] = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    @classmethod
+    def from_env(cls) -> "PhotoIndex | None":
+        """Open the index at PHOTO_INDEX_PATH (None if set to an empty string)."""
+        path = os.getenv("PHOTO_INDEX_PATH", DEFAULT_PATH)
+        if not path:
+            return None
+        return cls(path)
+
+    def get(self, place_id: str, photo_name: str) -> str | None:
+        """Return the CDN URL if `place_id` was uploaded from `photo_name`."""
+        with self._lock:
+            entry = self._entries.get(place_id)
+        if entry and entry.get("photo") == photo_name and entry.get("url"):
+            return entry["url"]
+        return None
+
+    def has(self, place_id: str) -> bool:
+        """Whether any photo of `place_id` has been indexed."""
+        with self._lock:
+            return place_id in self._entries
+
+    def update(self, photos: dict[str, tuple[str, str]]) -> None:
+        """Record (photo_name, cdn_url) pairs keyed by place_id."""
+        with self._lock:
+            for place_id, (photo_name, url) in photos.items():
+                if url:
+                    self._entries[place_id] = {"photo": photo_name, "url": url}
+                    self._dirty = True
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def save(self) -> None:
+        """Write the index to disk atomically (no-op if unchanged)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, indent=2, sort_keys=True)
+                f.write("\n")
+            os.replace(tmp, self.path)
+            self._dirty = False
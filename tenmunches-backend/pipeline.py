@@ -0,0 +1,202 @@
+"""
+Staged streaming pipeline for the TenMunches refresh.
+
+Items flow from a source iterator through named stages joined by bounded
+queues. Each stage runs on its own worker thread(s). A stage blocks when
+the queue after it is full, so a slow stage throttles everything upstream
+(backpressure) and at most `maxsize` items wait between any two stages,
+however large the input.
+
+Every stage keeps StageStats counters (items, busy time, throughput and
+current/peak input-queue depth) that can be read while the pipeline runs.
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator
+
+# Items allowed to wait between two stages
+QUEUE_SIZE = 4
+
+_DONE = object()  # end-of-stream marker
+
+
+class _Failure:
+    """Carries an exception from a worker thread to the consumer."""
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+class StageStats:
+    """Thread-safe throughput and queue-depth counters for one stage."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.depth = 0
+        self.max_depth = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.items += 1
+            self.busy += seconds
+
+    def observe_depth(self, depth: int) -> None:
+        with self._lock:
+            self.depth = depth
+            self.max_depth = max(self.max_depth, depth)
+
+    def merge(self, other: "StageStats") -> None:
+        """Add another run's counters to these (depth keeps the peak)."""
+        with self._lock:
+            self.items += other.items
+            self.busy += other.busy
+            self.max_depth = max(self.max_depth, other.max_depth)
+
+    @property
+    def throughput(self) -> float:
+        """Items per second of stage busy time."""
+        return self.items / self.busy if self.busy else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "items": self.items,
+                "busy_seconds": round(self.busy, 3),
+                "throughput": round(self.items / self.busy, 2) if self.busy else 0.0,
+                "queue_depth": self.depth,
+                "max_queue_depth": self.max_depth,
+            }
+
+    def __str__(self) -> str:
+        s = self.as_dict()
+        return (
+            f"{self.name}: {s['items']} items, {s['throughput']}/s busy, "
+            f"queue peak {s['max_queue_depth']}"
+        )
+
+
+class Pipeline:
+    """
+    A chain of `(name, fn, workers)` stages fed from one source iterator.
+
+    `fn` takes an item and returns the item for the next stage, or None to
+    drop it. With `threaded=False` every stage runs inline on the caller,
+    one item at a time, in source order. With several workers a stage may
+    reorder items.
+    """
+
+    def __init__(self, maxsize: int = QUEUE_SIZE, threaded: bool = True) -> None:
+        self.maxsize = maxsize
+        self.threaded = threaded
+        self._stages: list[tuple[str, Callable[[Any], Any], int]] = []
+        self.stats: dict[str, StageStats] = {}
+
+    def add(self, name: str, fn: Callable[[Any], Any], workers: int = 1) -> "Pipeline":
+        """Append a stage and return the pipeline (for chaining)."""
+        self._stages.append((name, fn, max(workers, 1)))
+        self.stats[name] = StageStats(name)
+        return self
+
+    def run(self, source: Iterable[Any]) -> Iterator[Any]:
+        """Yield the items that come out of the last stage."""
+        if not self.threaded:
+            return self._run_inline(source)
+        return self._run_threaded(source)
+
+    def _run_inline(self, source: Iterable[Any]) -> Iterator[Any]:
+        for item in source:
+            for name, fn, _ in self._stages:
+                started = time.perf_counter()
+                item = fn(item)
+                self.stats[name].record(time.perf_counter() - started)
+                if item is None:
+                    break
+            else:
+                yield item
+
+    def _run_threaded(self, source: Iterable[Any]) -> Iterator[Any]:
+        queues = [queue.Queue(self.maxsize) for _ in range(len(self._stages) + 1)]
+        cancel = threading.Event()
+        threads = [threading.Thread(
+            target=self._feed, args=(source, queues[0], cancel), name="pipeline-source", daemon=True,
+        )]
+        for i, (name, fn, workers) in enumerate(self._stages):
+            remaining = [workers]
+            lock = threading.Lock()
+            for w in range(workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(fn, self.stats[name], queues[i], queues[i + 1], cancel, remaining, lock),
+                    name=f"pipeline-{name}-{w}",
+                    daemon=True,
+                ))
+        for t in threads:
+            t.start()
+
+        out = queues[-1]
+        item = None
+        try:
+            while True:
+                item = out.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            # On error or early exit, stop the source, let workers drop what
+            # they hold, and drain until every stage has finished.
+            cancel.set()
+            while item is not _DONE:
+                item = out.get()
+            for t in threads:
+                t.join()
+
+    @staticmethod
+    def _feed(source: Iterable[Any], q: queue.Queue, cancel: threading.Event) -> None:
+        try:
+            for item in source:
+                if cancel.is_set():
+                    break
+                q.put(item)
+        except BaseException as e:
+            q.put(_Failure(e))
+        q.put(_DONE)
+
+    @staticmethod
+    def _work(
+        fn: Callable[[Any], Any],
+        stats: StageStats,
+        inbox: queue.Queue,
+        outbox: queue.Queue,
+        cancel: threading.Event,
+        remaining: list[int],
+        lock: threading.Lock,
+    ) -> None:
+        while True:
+            item = inbox.get()
+            stats.observe_depth(inbox.qsize())
+            if item is _DONE:
+                inbox.put(_DONE)  # let sibling workers see it too
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    outbox.put(_DONE)
+                return
+            if cancel.is_set():
+                continue
+            if not isinstance(item, _Failure):
+                started = time.perf_counter()
+                try:
+                    item = fn(item)
+                except BaseException as e:
+                    item = _Failure(e)
+                stats.record(time.perf_counter() - started)
+            if item is not None:
+                outbox.put(item)
@@ -0,0 +1,203 @@
+"""
+On-disk response cache for the Google Places API client.
+
+Entries are content-addressed: the key is a SHA-256 of the request method,
+URL, field mask and JSON body (never the API key), so identical requests
+share one entry. Each entry is a zlib-compressed JSON record stored under
+`<dir>/<key[:2]>/<key>.z`. Entries expire after a per-endpoint TTL, and the
+least recently used entries are evicted once the cache exceeds its size
+budget.
+
+Modes (PLACES_CACHE_MODE):
+  - off:    no caching (default; what the weekly refresh uses)
+  - on:     serve fresh entries from disk, store new responses
+  - replay: serve only from disk, ignoring TTLs; misses never hit the network
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Any
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODES = ("off", "on", "replay")
+
+DEFAULT_DIR = os.path.join(os.path.dirname(__file__), ".cache", "places")
+DEFAULT_TTLS = {
+    "search": 24 * 3600,        # search rankings shift daily
+    "details": 7 * 24 * 3600,   # details are refreshed weekly anyway
+}
+
+
+class ResponseCache:
+    """Size-bounded, TTL-aware on-disk cache of Places API JSON responses."""
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_DIR,
+        mode: str = "on",
+        max_bytes: int = 200 * 1024 * 1024,
+        ttls: dict[str, float] | None = None,
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown cache mode '{mode}' (expected one of {MODES})")
+        self.directory = directory
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self._lock = threading.Lock()
+        self._size: int | None = None  # computed lazily on first write
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        """Build a cache from PLACES_CACHE_* environment variables."""
+        return cls(
+            directory=os.getenv("PLACES_CACHE_DIR", DEFAULT_DIR),
+            mode=os.getenv("PLACES_CACHE_MODE", "off"),
+            max_bytes=int(float(os.getenv("PLACES_CACHE_MAX_MB", "200")) * 1024 * 1024),
+            ttls={
+                "search": float(os.getenv("PLACES_CACHE_SEARCH_TTL", DEFAULT_TTLS["search"])),
+                "details": float(os.getenv("PLACES_CACHE_DETAILS_TTL", DEFAULT_TTLS["details"])),
+            },
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def replay(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def key(
+        method: str,
+        url: str,
+        field_mask: str,
+        body: dict[str, Any] | None = None,
+    ) -> str:
+        """Content address of a request."""
+        payload = json.dumps(
+            [method.upper(), url, field_mask, body],
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.z")
+
+    def get(
+        self,
+        endpoint: str,
+        method: str,
+        url: str,
+        field_mask: str,
+        body: dict[str, Any] | None = None,
+    ) -> dict[str, Any] | None:
+        """Return the cached response body, or None on a miss or expiry."""
+        if not self.enabled:
+            return None
+        path = self._path(self.key(method, url, field_mask, body))
+        try:
+            with open(path, "rb") as f:
+                record = json.loads(zlib.decompress(f.read()))
+        except (OSError, zlib.error, ValueError):
+            return None
+
+        age = time.time() - record.get("ts", 0)
+        if not self.replay and age > self.ttls.get(endpoint, 0):
+            return None
+        try:
+            os.utime(path)  # mark as recently used for LRU eviction
+        except OSError:
+            pass
+        return record.get("body")
+
+    def put(
+        self,
+        endpoint: str,
+        method: str,
+        url: str,
+        field_mask: str,
+        body: dict[str, Any] | None,
+        response: dict[str, Any],
+    ) -> None:
+        """Store a successful response body. No-op in off/replay modes."""
+        if self.mode != "on":
+            return
+        path = self._path(self.key(method, url, field_mask, body))
+        data = zlib.compress(
+            json.dumps(
+                {"ts": time.time(), "endpoint": endpoint, "body": response},
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ).encode("utf-8"),
+            level=6,
+        )
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"  ⚠️  Places cache write failed: {e}")
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def clear(self) -> None:
+        """Delete every cached entry."""
+        with self._lock:
+            for path, _, _ in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+
+    def _entries(self) -> list[tuple[str, float, int]]:
+        """Return (path, last_used, size) for every entry on disk."""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".z"):
+                    st = entry.stat()
+                    entries.append((entry.path, st.st_mtime, st.st_size))
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(size for _, _, size in self._entries())
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until under 90% of the budget."""
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        size = sum(e[2] for e in entries)
+        for path, _, entry_size in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+                size -= entry_size
+            except OSError:
+                pass
+        self._size = size
@@ -2,9 +2,20 @@
 Business ranking for TenMunches.
 
 Score = base rating + normalized sentiment + review volume bonus.
+
+`compute_scores` scores a whole candidate pool at once from columnar
+arrays; `compute_score` is the one-business reference it must match.
+Ranking is stable: businesses with equal (rounded) scores keep their
+input order, i.e. the order candidates came back from search.
 """
 
-from typing import Any
+import math
+from typing import Any, Sequence
+
+import numpy as np
+
+# Score precision (decimal places), applied with Python's round()
+SCORE_DIGITS = 3
 
 
 def compute_score(biz: dict[str, Any]) -> float:
@@ -22,7 +33,7 @@ def compute_score(biz: dict[str, Any]) -> float:
 
     if reviews:
         sentiments = [r.get("sentiment", 0) for r in reviews]
-        avg_sentiment = sum(sentiments) / len(sentiments)
+        avg_sentiment = math.fsum(sentiments) / len(sentiments)
     else:
         avg_sentiment = 0
 
@@ -33,11 +44,93 @@ def compute_score(biz: dict[str, Any]) -> float:
     elif num_reviews > 100:
         score += 0.25
 
-    return round(score, 3)
+    return round(score, SCORE_DIGITS)
+
+
+def to_columns(
+    businesses: Sequence[dict[str, Any]],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Flatten businesses into (ratings, review_counts, sentiments, offsets).
+
+    The sentiments of business i are `sentiments[offsets[i]:offsets[i + 1]]`.
+    """
+    ratings = np.array([b.get("rating", 0) or 0 for b in businesses], dtype=np.float64)
+    counts = np.array([b.get("review_count", 0) or 0 for b in businesses], dtype=np.int64)
+    lengths = [len(b.get("reviews", [])) for b in businesses]
+    offsets = np.zeros(len(businesses) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    sentiments = np.array(
+        [r.get("sentiment", 0) for b in businesses for r in b.get("reviews", [])],
+        dtype=np.float64,
+    )
+    return ratings, counts, sentiments, offsets
+
+
+def compute_scores(
+    ratings: np.ndarray,
+    review_counts: np.ndarray,
+    sentiments: np.ndarray,
+    offsets: np.ndarray,
+) -> np.ndarray:
+    """
+    Composite scores for a pool of businesses, identical to compute_score.
+
+    Per-business sentiment sums use math.fsum, like compute_score: it is
+    exactly rounded, so the result doesn't depend on summation order (NumPy
+    and Python 3.12+'s sum() each add differently). The final rounding is
+    done with Python's round() (NumPy's round differs on ties).
+    """
+    lengths = np.diff(offsets)
+    values = sentiments.tolist()
+    bounds = offsets.tolist()
+    sums = np.array(
+        [math.fsum(values[a:b]) for a, b in zip(bounds, bounds[1:])], dtype=np.float64,
+    )
+    avg = sums / np.maximum(lengths, 1)  # 0 for businesses without reviews
+
+    scores = ratings + (avg + 1) / 2
+    scores += np.where(review_counts > 500, 0.5, np.where(review_counts > 100, 0.25, 0.0))
+    return np.array([round(s, SCORE_DIGITS) for s in scores.tolist()], dtype=np.float64)
+
+
+def rank_order(scores: np.ndarray, k: int | None = None) -> np.ndarray:
+    """
+    Indices of the `k` best scores (all if None), best first.
+
+    Ties keep input order. For k < n, an O(n) partition finds the k-th
+    best score and only businesses at or above it are sorted.
+    """
+    n = len(scores)
+    if k is None or k >= n:
+        return np.argsort(-scores, kind="stable")
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    threshold = -np.partition(-scores, k - 1)[k - 1]
+    candidates = np.flatnonzero(scores >= threshold)
+    return candidates[np.argsort(-scores[candidates], kind="stable")][:k]
+
+
+def _score_all(businesses: list[dict[str, Any]]) -> np.ndarray:
+    scores = compute_scores(*to_columns(businesses))
+    for biz, score in zip(businesses, scores.tolist()):
+        biz["score"] = score
+    return scores
 
 
 def rank_businesses(businesses: list[dict[str, Any]]) -> list[dict[str, Any]]:
     """Rank businesses by composite score, descending."""
-    for biz in businesses:
-        biz["score"] = compute_score(biz)
-    return sorted(businesses, key=lambda b: b["score"], reverse=True)
+    scores = _score_all(businesses)
+    return [businesses[i] for i in rank_order(scores)]
+
+
+def top_k(businesses: list[dict[str, Any]], k: int = 10) -> list[dict[str, Any]]:
+    """
+    Return the `k` highest-scoring businesses, best first.
+
+    Every business is scored, but only the top of the pool is sorted.
+    Ties keep their input order, so the result is the same as
+    `rank_businesses(businesses)[:k]`.
+    """
+    scores = _score_all(businesses)
+    return [businesses[i] for i in rank_order(scores, k)]
@@ -0,0 +1,40 @@
+"""
+Thread-safe token-bucket rate limiter for TenMunches provider calls.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Allow `rate` tokens per second on average, with bursts up to `capacity`.
+
+    `acquire(n)` blocks until `n` tokens are available. A rate of 0 or less
+    disables limiting.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Take `tokens`, sleeping as needed. Returns the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
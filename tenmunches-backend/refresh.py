@@ -4,116 +4,654 @@ Data refresh pipeline for TenMunches.
 Fetches fresh data from Google Places API, processes it through the
 NLP pipeline, uploads images to Cloudinary, and stores results in MongoDB.
 
-Can be run standalone: python refresh.py
+Categories are processed concurrently. Each pipeline stage (Places detail
+fetches, sentiment analysis, Cloudinary uploads) has its own bounded worker
+pool shared by every category in flight, so per-provider concurrency stays
+fixed no matter how many categories run at once. Detail fetches go through
+a single pooled HTTP/2 AsyncPlacesClient running on a background event
+loop. Pool sizes are read from the environment (see .env.sample); setting
+a size to 1 runs that stage serially.
+
+Within a category, search pages stream through the stages as separate
+batches (see pipeline.py): bounded queues between stages apply
+backpressure, and per-stage throughput and queue-depth counters are
+printed at the end of a run.
+
+Work is partitioned by (city, category) (see cities.py); a run refreshes
+every partition of the enabled cities, or one shard of them.
+
+Can be run standalone: python refresh.py [--full] [--city SLUG] [--shard I/N] [--rollback]
 """
 
+import argparse
+import asyncio
+import hashlib
+import os
+import threading
 import time
-from typing import Any
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from typing import Any, Callable, Iterator
 
-from google_places import search_places, get_place_details, simplify_place
-from sentiment import process_reviews, summarize_themes
-from ranker import rank_businesses
+from google_places import (
+    AsyncPlacesClient,
+    build_photo_url,
+    get_place_details,
+    iter_search_pages,
+    photo_name,
+    simplify_place,
+)
+from nlp_stage import NLPStage
+from photo_index import PhotoIndex
+from pipeline import QUEUE_SIZE, Pipeline, StageStats
+from review_memo import ReviewMemo
+from sentiment import ANALYZER_VERSION, process_reviews, summarize_themes
+from ranker import top_k
+from rate_limit import TokenBucket
 from testimonials import select_testimonials
-from cloudinary_service import upload_photo
-from db import upsert_category, log_refresh
+from cloudinary_service import upload_photos
+from cities import (
+    DEFAULT_CITY,
+    Partition,
+    city_name,
+    parse_shard,
+    partitions,
+    shard,
+)
+from db import (
+    ensure_indexes,
+    get_place_snapshots,
+    log_refresh,
+    new_snapshot_version,
+    publish_snapshot,
+    rollback_snapshot,
+    upsert_place_snapshots,
+    write_snapshot,
+)
+
+# Refresh only this machine's share of partitions ("<index>/<count>")
+SHARD = os.getenv("REFRESH_SHARD", "")
+
+# Extra search queries that widen a category's candidate pool. Results of
+# overlapping queries are de-duplicated by place id before any detail fetch.
+CATEGORY_QUERIES: dict[str, list[str]] = {
+    "ice cream": ["ice cream", "gelato"],
+    "bbq": ["bbq", "barbecue"],
+    "sandwiches": ["sandwiches", "deli"],
+}
+
+# Concurrency limits (per stage, shared across all categories in flight)
+CATEGORY_WORKERS = int(os.getenv("REFRESH_CATEGORY_WORKERS", "4"))
+DETAILS_WORKERS = int(os.getenv("REFRESH_DETAILS_WORKERS", "8"))
+UPLOAD_WORKERS = int(os.getenv("REFRESH_UPLOAD_WORKERS", "4"))
+NLP_WORKERS = int(os.getenv("REFRESH_NLP_WORKERS", str(os.cpu_count() or 1)))
 
-CATEGORIES = [
-    "coffee", "pizza", "burger", "vegan", "bakery",
-    "brunch", "sushi", "thai", "chinese", "indian",
-    "mexican", "korean", "italian", "mediterranean", "seafood",
-    "sandwiches", "ice cream", "bars", "bbq", "ramen",
-]
+# Cloudinary uploads per second across all categories (0 = unlimited)
+UPLOAD_RATE = float(os.getenv("REFRESH_UPLOAD_RATE", "5"))
 
+# Generate Gemini review summaries for each category's top 10
+AI_SUMMARIES = os.getenv("REFRESH_AI_SUMMARIES", "0").lower() in ("1", "true", "yes")
 
-def process_category(category: str) -> dict[str, Any]:
+# Search pages allowed to wait between two pipeline stages, per category
+PIPELINE_QUEUE_SIZE = int(os.getenv("REFRESH_QUEUE_SIZE", str(QUEUE_SIZE)))
+
+# Incremental refresh: stored place snapshots older than this are re-enriched
+SNAPSHOT_MAX_AGE_DAYS = int(os.getenv("REFRESH_SNAPSHOT_MAX_AGE_DAYS", "28"))
+
+# Themes kept per place in the stored themes_summary (most mentioned first)
+THEMES_SUMMARY_LIMIT = 3
+
+# Receives one event dict per partition start/finish/failure and per publish
+ProgressCallback = Callable[[dict[str, Any]], None]
+
+
+class PlacesLoop:
     """
-    Process a single category:
-    1. Search Google Places
-    2. Fetch details + reviews
-    3. Sentiment analysis
-    4. Upload photos to Cloudinary
-    5. Rank and take top 10
-    6. Extract testimonials
+    Runs one shared AsyncPlacesClient on a background event loop so that
+    category worker threads can fetch a whole category's details at once
+    over the same pooled connection. The client memoizes details, so a place
+    that shows up in several categories is only fetched once per refresh.
     """
-    print(f"📍 Processing category: {category}")
 
-    raw_places = search_places(category)
-    enriched: list[dict[str, Any]] = []
+    def __init__(self, max_concurrency: int = DETAILS_WORKERS) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="places-loop", daemon=True,
+        )
+        self._thread.start()
+        try:
+            self._client = self._call(self._open(max_concurrency))
+        except Exception:
+            self._stop()
+            raise
+
+    async def _open(self, max_concurrency: int) -> AsyncPlacesClient:
+        return AsyncPlacesClient(max_concurrency=max_concurrency, memoize_details=True)
+
+    def _submit(self, coro: Any) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def _call(self, coro: Any) -> Any:
+        return self._submit(coro).result()
+
+    def submit_details(self, place_ids: list[str]) -> Future:
+        """Start fetching details for `place_ids`; returns a Future of the list."""
+        return self._submit(self._client.get_many_details(place_ids))
+
+    def get_many_details(self, place_ids: list[str]) -> list[dict[str, Any]]:
+        """Fetch details for `place_ids` concurrently (blocking the caller)."""
+        return self.submit_details(place_ids).result()
+
+    def iter_search_pages(self, query: str, location: str) -> Iterator[list[dict[str, Any]]]:
+        """Yield pages of search results from the shared client as they arrive."""
+        pages = self._client.iter_search_pages(query, location)
+        try:
+            while True:
+                try:
+                    yield self._call(_anext(pages))
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._call(pages.aclose())
+
+    def close(self) -> None:
+        """Close the client and stop the event loop."""
+        self._call(self._client.aclose())
+        self._stop()
+
+    def _stop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+class RefreshPools:
+    """
+    Bounded worker pools for the I/O- and CPU-heavy refresh stages.
+
+    Detail fetches share one async Places client capped at
+    `details_workers` in-flight requests. Uploads are network-bound and run
+    on threads, throttled by one token bucket at `upload_rate` per second;
+    sentiment analysis is CPU-bound (TextBlob holds the GIL) and runs on an
+    NLPStage process pool. A stage configured with a single worker runs
+    inline on the caller.
+
+    The NLP workers start first, before any other pool starts threads, so
+    a standalone refresh (which builds the pools before connecting to
+    MongoDB) can fork them (see NLPStage).
+    """
+
+    def __init__(
+        self,
+        details_workers: int = DETAILS_WORKERS,
+        upload_workers: int = UPLOAD_WORKERS,
+        nlp_workers: int = NLP_WORKERS,
+        upload_rate: float = UPLOAD_RATE,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+    ) -> None:
+        self.memo = ReviewMemo.from_env()
+        self.nlp = NLPStage(nlp_workers, memo=self.memo)
+        self.places = PlacesLoop(details_workers)
+        self.uploads = _thread_pool(upload_workers, "upload")
+        self.upload_limiter = TokenBucket(upload_rate)
+        self.photos = PhotoIndex.from_env()
+        self.queue_size = queue_size
+        self.stage_stats: dict[str, StageStats] = {}
+        self._stats_lock = threading.Lock()
+
+    def __enter__(self) -> "RefreshPools":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.shutdown()
+
+    def record(self, stats: dict[str, StageStats]) -> None:
+        """Add one category's pipeline counters to the run totals."""
+        with self._stats_lock:
+            for name, stage in stats.items():
+                self.stage_stats.setdefault(name, StageStats(name)).merge(stage)
+
+    def shutdown(self) -> None:
+        """Wait for outstanding work and release all worker pools."""
+        if self.uploads is not None:
+            self.uploads.shutdown(wait=True)
+        self.nlp.close()
+        self.places.close()
+        if self.memo is not None:
+            self.memo.close()
+        if self.photos is not None:
+            self.photos.save()
+
+
+async def _anext(iterator: Any) -> Any:
+    return await iterator.__anext__()
+
+
+def _thread_pool(workers: int, name: str) -> ThreadPoolExecutor | None:
+    if workers <= 1:
+        return None
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+
+def _reviews_hash(reviews: list[dict[str, Any]]) -> str:
+    """Stable hash of a place's review texts (order-sensitive)."""
+    h = hashlib.sha1()
+    for r in reviews:
+        h.update(r.get("text", "").encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _fingerprint(place: dict[str, Any]) -> dict[str, Any]:
+    """Fingerprint of the upstream data an enriched place was built from."""
+    return {
+        "rating": place.get("rating", 0),
+        "review_count": place.get("review_count", 0),
+        "reviews_hash": _reviews_hash(place.get("reviews", [])),
+        "analyzer": ANALYZER_VERSION,
+    }
 
-    for place in raw_places:
-        place_id = place.get("id", "")
-        if not place_id:
-            continue
 
-        details = get_place_details(place_id)
+def _is_fresh(snapshot: dict[str, Any], hit: dict[str, Any]) -> bool:
+    """
+    True if a stored snapshot still matches a search hit.
+
+    New reviews always bump `userRatingCount`, so an unchanged rating and
+    count mean the stored reviews, themes and photo can be reused without
+    fetching details again. Snapshots older than SNAPSHOT_MAX_AGE_DAYS are
+    always re-enriched so names, addresses and photos don't drift forever.
+    """
+    fp = snapshot.get("fingerprint", {})
+    refreshed_at = snapshot.get("refreshed_at")
+    if refreshed_at is None:
+        return False
+    if refreshed_at.tzinfo is None:
+        refreshed_at = refreshed_at.replace(tzinfo=timezone.utc)
+    age = datetime.now(timezone.utc) - refreshed_at
+    return (
+        age < timedelta(days=SNAPSHOT_MAX_AGE_DAYS)
+        and fp.get("analyzer") == ANALYZER_VERSION
+        and fp.get("rating") == hit.get("rating", 0)
+        and fp.get("review_count") == hit.get("userRatingCount", 0)
+    )
+
+
+def _from_snapshot(snapshot: dict[str, Any]) -> dict[str, Any]:
+    """Strip snapshot bookkeeping fields, leaving the enriched place."""
+    return {k: v for k, v in snapshot.items() if k not in ("fingerprint", "refreshed_at")}
+
+
+def _search_batches(
+    category: str,
+    location: str,
+    pools: RefreshPools | None,
+    incremental: bool,
+    hits: dict[str, dict[str, Any]],
+    snapshots: dict[str, dict[str, Any]],
+    reused: dict[str, dict[str, Any]],
+) -> Iterator[Future]:
+    """
+    Stream search pages from every query for the category.
+
+    Each page's new places are checked against stored snapshots; fresh ones
+    go into `reused`, and detail fetches for the rest start right away, so
+    one Future of details is yielded per page while later pages are still
+    being requested.
+    """
+    for query in CATEGORY_QUERIES.get(category, [category]):
+        if pools:
+            pages = pools.places.iter_search_pages(query, location)
+        else:
+            pages = iter_search_pages(query, location)
+        for page in pages:
+            new_ids = []
+            for p in page:
+                if p.get("id") and p["id"] not in hits:
+                    hits[p["id"]] = p
+                    new_ids.append(p["id"])
+            if incremental and new_ids:
+                snapshots.update(get_place_snapshots(new_ids))
+
+            stale_ids: list[str] = []
+            for place_id in new_ids:
+                snapshot = snapshots.get(place_id)
+                if snapshot and _is_fresh(snapshot, hits[place_id]):
+                    reused[place_id] = _from_snapshot(snapshot)
+                else:
+                    stale_ids.append(place_id)
+            if not stale_ids:
+                continue
+            if pools:
+                yield pools.places.submit_details(stale_ids)
+            else:
+                batch: Future = Future()
+                batch.set_result([get_place_details(pid) for pid in stale_ids])
+                yield batch
+
+
+def _details_stage(batch: Future) -> list[dict[str, Any]] | None:
+    """Wait for a page's details and normalize them into places."""
+    places: list[dict[str, Any]] = []
+    for details in batch.result():
         if not details:
             continue
-
         reviews_raw = details.get("reviews", [])
-        place_data = simplify_place(details, reviews_raw)
+        place = simplify_place(details, reviews_raw)
+        # Photos are only uploaded for the winners (see _upload_photos), so
+        # keep the photo reference instead of a keyed Google media URL
+        place["photo_name"] = photo_name(details)
+        place["photo_url"] = ""
+        places.append(place)
+    return places or None
 
-        # Run sentiment analysis on reviews
-        processed_reviews = process_reviews(place_data.get("reviews", []))
-        place_data["reviews"] = processed_reviews
 
-        # Upload photo to Cloudinary for permanent CDN hosting
-        google_photo_url = place_data.get("photo_url", "")
-        if google_photo_url:
-            cdn_url = upload_photo(google_photo_url, place_data["id"])
-            place_data["photo_url"] = cdn_url
-            time.sleep(0.1)  # Rate-limit politeness
+def _nlp_stage(
+    places: list[dict[str, Any]],
+    pools: RefreshPools | None,
+    snapshots: dict[str, dict[str, Any]],
+) -> list[dict[str, Any]]:
+    """
+    Run sentiment analysis on reviews, reusing stored results when the
+    review texts haven't changed.
+    """
+    to_score: list[dict[str, Any]] = []
+    for place in places:
+        place["fingerprint"] = _fingerprint(place)
+        snapshot = snapshots.get(place["id"])
+        if snapshot and snapshot.get("fingerprint", {}) == place["fingerprint"]:
+            place["reviews"] = snapshot.get("reviews", [])
+            themes = snapshot.get("themes_summary", {})
+            place["themes_summary"] = dict(list(themes.items())[:THEMES_SUMMARY_LIMIT])
+        else:
+            to_score.append(place)
 
+    review_lists = [place.get("reviews", []) for place in to_score]
+    if pools:
+        processed_lists = pools.nlp.process(review_lists)
+    else:
+        processed_lists = [process_reviews(reviews) for reviews in review_lists]
+    for place, processed in zip(to_score, processed_lists):
+        place["reviews"] = processed
         # Summarize themes
-        place_data["themes_summary"] = summarize_themes(processed_reviews)
+        place["themes_summary"] = summarize_themes(processed, THEMES_SUMMARY_LIMIT)
+    return places
+
+
+def _upload_photos(places: list[dict[str, Any]], pools: RefreshPools | None) -> None:
+    """
+    Upload photos to Cloudinary for permanent CDN hosting. Photos indexed
+    under the same Google reference are reused without calling Cloudinary;
+    the rest get one batched existence check, and only missing or changed
+    images are uploaded.
+    """
+    photo_index = pools.photos if pools else None
+    to_upload: dict[str, dict[str, Any]] = {}
+    changed: list[str] = []
+    for place in places:
+        name = place.get("photo_name")
+        if not name:
+            continue  # no photo, or an older snapshot already on the CDN
+        if photo_index is not None:
+            indexed_url = photo_index.get(place["id"], name)
+            if indexed_url:
+                place["photo_url"] = indexed_url
+                continue
+            if photo_index.has(place["id"]):
+                changed.append(place["id"])
+        to_upload[place["id"]] = place
+
+    if not to_upload:
+        return
+    cdn_urls = upload_photos(
+        {pid: build_photo_url({"photos": [{"name": place["photo_name"]}]})
+         for pid, place in to_upload.items()},
+        executor=pools.uploads if pools else None,
+        limiter=pools.upload_limiter if pools else None,
+        replace=changed,
+    )
+    for pid, place in to_upload.items():
+        place["photo_url"] = cdn_urls.get(pid, "")
+    if photo_index is not None:
+        photo_index.update({
+            pid: (place["photo_name"], place["photo_url"]) for pid, place in to_upload.items()
+        })
+        photo_index.save()
+
+
+def _add_summaries(category: str, location: str, places: list[dict[str, Any]]) -> None:
+    """Add a Gemini review summary to each place (one batched call; needs google-genai)."""
+    from gemini_summarizer import summarize_places
 
-        enriched.append(place_data)
+    summaries = summarize_places(places, category, city=location)
+    for place in places:
+        place["summary"] = summaries.get(place["id"], "")
+
+
+def _store_stage(places: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Save enriched places back as snapshots."""
+    refreshed_at = datetime.now(timezone.utc)
+    upsert_place_snapshots([{**place, "refreshed_at": refreshed_at} for place in places])
+    return places
+
+
+def process_category(
+    category: str,
+    pools: RefreshPools | None = None,
+    incremental: bool = True,
+    city: str = DEFAULT_CITY,
+) -> dict[str, Any]:
+    """
+    Process a single (city, category) partition:
+    1. Search Google Places
+    2. Fetch details + reviews
+    3. Sentiment analysis
+    4. Score every place and keep the top 10 (ranker.top_k: np.partition
+       finds the 10th-best score, then only places at or above it are
+       stably sorted, so ties keep search order)
+    5. Upload photos to Cloudinary (top 10 only)
+    6. Extract testimonials (and, optionally, AI summaries)
+
+    Steps 1–3 (plus saving snapshots) form a streaming pipeline: each search
+    page moves through details → nlp → store as its own batch, with bounded
+    queues between stages. With `pools`, every stage runs on its own
+    thread, so NLP scores one page while later pages are still being
+    fetched; otherwise the stages run serially, page by page. The
+    expensive per-place enrichment in steps 5–6 only runs for the winners.
+
+    When `incremental` is set, places whose stored fingerprint still matches
+    skip steps 2–3 and reuse their stored snapshot. Places whose review
+    texts are unchanged skip sentiment analysis. Every place enriched in
+    this run is saved back as a new snapshot, incremental or not.
+    """
+    print(f"📍 Processing category: {category} ({city})")
+    location = city_name(city)
+
+    hits: dict[str, dict[str, Any]] = {}
+    snapshots: dict[str, dict[str, Any]] = {}
+    by_id: dict[str, dict[str, Any]] = {}
+
+    pipeline = (
+        Pipeline(maxsize=pools.queue_size if pools else QUEUE_SIZE, threaded=pools is not None)
+        .add("details", _details_stage)
+        .add("nlp", lambda places: _nlp_stage(places, pools, snapshots))
+        .add("store", _store_stage)
+    )
+    fresh: list[dict[str, Any]] = []
+    for places in pipeline.run(
+        _search_batches(category, location, pools, incremental, hits, snapshots, by_id)
+    ):
+        fresh.extend(places)
+    if pools:
+        pools.record(pipeline.stats)
+
+    reused = len(by_id)
+    for place in fresh:
+        by_id[place["id"]] = _from_snapshot(place)
+    enriched = [by_id[pid] for pid in hits if pid in by_id]
+    print(f"  ♻️  {city}/{category}: {len(hits)} candidates, reused {reused}, enriched {len(fresh)}")
 
     # Rank and take top 10
-    ranked = rank_businesses(enriched)
-    top_10 = ranked[:10]
+    top_10 = top_k(enriched, 10)
 
-    # Extract testimonials for top 10
+    # Enrich only the winners: photos, testimonials, optional AI summaries
+    _upload_photos(top_10, pools)
     for biz in top_10:
         biz["testimonials"] = select_testimonials(biz.get("reviews", []))
+    if AI_SUMMARIES:
+        _add_summaries(category, location, top_10)
 
     # Strip raw reviews from final output (they're large and not needed by frontend)
     for biz in top_10:
         biz.pop("reviews", None)
         biz.pop("score", None)
+        biz.pop("photo_name", None)
 
     return {
+        "city": city,
         "category": category,
         "top_10": top_10,
     }
 
 
-def run_full_refresh() -> None:
+def scheduled_partitions(
+    cities: list[str] | None = None,
+    shard_spec: str = SHARD,
+) -> list[Partition]:
+    """The (city, category) partitions this machine should refresh."""
+    parts = partitions(cities)
+    if shard_spec:
+        parts = shard(parts, *parse_shard(shard_spec))
+    return parts
+
+
+def run_full_refresh(
+    category_workers: int = CATEGORY_WORKERS,
+    incremental: bool = True,
+    cities: list[str] | None = None,
+    shard_spec: str = SHARD,
+    progress: ProgressCallback | None = None,
+) -> dict[str, Any]:
     """
-    Run the full pipeline for all 20 categories and store in MongoDB.
+    Run the full pipeline for every (city, category) partition of `cities`
+    (default: REFRESH_CITIES) and store the results in MongoDB.
+
+    Up to `category_workers` partitions are processed at once, interleaved
+    across cities. With `shard_spec` ("<index>/<count>"), only this
+    machine's share of the partitions is refreshed. Pass
+    `incremental=False` to ignore stored place snapshots and re-enrich
+    every place.
+
+    Results are staged as a new snapshot version in one bulk write, then
+    each city's active-snapshot pointer is switched to it atomically, so
+    readers never see a half-refreshed city. Categories that failed keep
+    their previous data. Use --rollback to switch a city back.
+
+    `progress`, if given, is called (from worker threads) with an event
+    dict as each partition starts, finishes or fails and as each city is
+    published. Returns a summary: status, snapshot version, elapsed
+    seconds and errors.
     """
     print("🚀 Starting full data refresh...")
     start = time.time()
     errors: list[str] = []
+    results: list[dict[str, Any]] = []
+    parts = scheduled_partitions(cities, shard_spec)
+    report = progress or (lambda event: None)
+    report({"event": "planned", "partitions": [f"{city}/{category}" for city, category in parts]})
 
-    for category in CATEGORIES:
+    def run_partition(city: str, category: str, pools: RefreshPools) -> dict[str, Any]:
+        partition = {"city": city, "category": category}
+        report({"event": "started", **partition})
+        t0 = time.monotonic()
         try:
-            data = process_category(category)
-            upsert_category(data)
-            print(f"  ✅ {category}: {len(data['top_10'])} places stored")
+            data = process_category(category, pools, incremental, city)
         except Exception as e:
-            msg = f"❌ Error in '{category}': {e}"
-            print(msg)
-            errors.append(msg)
+            seconds = round(time.monotonic() - t0, 2)
+            report({"event": "failed", **partition, "seconds": seconds, "error": str(e)})
+            raise
+        seconds = round(time.monotonic() - t0, 2)
+        report({"event": "finished", **partition, "seconds": seconds, "places": len(data["top_10"])})
+        return data
+
+    # The pools come first: NLP workers can only be forked before the
+    # MongoDB client (or anything else) starts threads
+    with RefreshPools() as pools, ThreadPoolExecutor(
+        max_workers=max(category_workers, 1),
+        thread_name_prefix="category",
+    ) as category_pool:
+        ensure_indexes()
+        futures = {
+            category_pool.submit(run_partition, city, category, pools): (city, category)
+            for city, category in parts
+        }
+        for future in as_completed(futures):
+            city, category = futures[future]
+            try:
+                data = future.result()
+                results.append(data)
+                print(f"  ✅ {city}/{category}: {len(data['top_10'])} places ranked")
+            except Exception as e:
+                msg = f"❌ Error in '{city}/{category}': {e}"
+                print(msg)
+                errors.append(msg)
+
+    for stage in pools.stage_stats.values():
+        print(f"  📊 {stage}")
+
+    # Stage every result under one new version, then publish city by city
+    version = new_snapshot_version()
+    write_snapshot(version, results)
+    refreshed: dict[str, set[str]] = {}
+    for data in results:
+        refreshed.setdefault(data["city"], set()).add(data["category"])
+    for city, categories in refreshed.items():
+        previous = publish_snapshot(city, version, categories)
+        print(f"  📸 {city}: snapshot {version} active (previous: {previous})")
+        report({"event": "published", "city": city, "snapshot": version})
 
     elapsed = round(time.time() - start, 1)
     status = "success" if not errors else "partial"
-    details = f"Completed in {elapsed}s. Errors: {len(errors)}"
+    details = (
+        f"Completed {len(parts)} partitions in {elapsed}s (snapshot {version}). "
+        f"Errors: {len(errors)}"
+    )
     if errors:
         details += "\n" + "\n".join(errors)
 
     log_refresh(status=status, details=details)
     print(f"🏁 Refresh complete in {elapsed}s ({status})")
+    return {"status": status, "snapshot": version, "seconds": elapsed, "errors": errors}
 
 
 if __name__ == "__main__":
-    run_full_refresh()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="ignore stored place snapshots and re-enrich every place",
+    )
+    parser.add_argument(
+        "--city",
+        action="append",
+        help="city slug to refresh (repeatable; default: REFRESH_CITIES)",
+    )
+    parser.add_argument(
+        "--shard",
+        default=SHARD,
+        help="refresh only shard <index>/<count> of the partitions (e.g. 0/4)",
+    )
+    parser.add_argument(
+        "--rollback",
+        action="store_true",
+        help="switch the given cities back to their previous snapshot and exit",
+    )
+    args = parser.parse_args()
+    if args.rollback:
+        for city in args.city or [DEFAULT_CITY]:
+            print(f"⏪ {city}: snapshot {rollback_snapshot(city)} active")
+    else:
+        run_full_refresh(incremental=not args.full, cities=args.city, shard_spec=args.shard)
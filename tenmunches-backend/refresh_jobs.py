@@ -0,0 +1,133 @@
+"""
+Background refresh jobs for TenMunches.
+
+A refresh takes minutes, so the API doesn't run it inside a request:
+`start_refresh` runs run_full_refresh on its own thread and returns a
+RefreshJob at once, which records per-partition progress and timings as
+the refresh reports them (see GET /api/refresh/{id}).
+
+Only one refresh runs per process at a time, whether started manually or
+by the scheduler: starting one while another is running returns the
+running job instead. Jobs live in memory (the last MAX_JOBS of them), so
+an ID is only known to the server process that started it.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any
+
+MAX_JOBS = 20
+
+_lock = threading.Lock()
+_jobs: OrderedDict[str, "RefreshJob"] = OrderedDict()
+_running: "RefreshJob | None" = None
+
+
+class RefreshJob:
+    """State of one refresh run; updated from the refresh's worker threads."""
+
+    def __init__(self, trigger: str, options: dict[str, Any]) -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.trigger = trigger
+        self.options = options
+        self.status = "pending"  # -> running -> success | partial | failed
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at: datetime | None = None
+        self.result: dict[str, Any] | None = None
+        self.error: str | None = None
+        self.partitions: dict[str, dict[str, Any]] = {}
+        self.events: list[dict[str, Any]] = []
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status not in ("pending", "running")
+
+    def record(self, event: dict[str, Any]) -> None:
+        """Apply a run_full_refresh progress event."""
+        event = {**event, "at": round(time.monotonic() - self._start, 2)}
+        with self._lock:
+            self.events.append(event)
+            kind = event["event"]
+            if kind == "planned":
+                for name in event["partitions"]:
+                    self.partitions[name] = {"status": "queued"}
+            elif kind in ("started", "finished", "failed"):
+                entry = self.partitions.setdefault(f"{event['city']}/{event['category']}", {})
+                entry["status"] = "running" if kind == "started" else kind
+                for key in ("seconds", "places", "error"):
+                    if key in event:
+                        entry[key] = event[key]
+
+    def events_since(self, index: int) -> list[dict[str, Any]]:
+        with self._lock:
+            return self.events[index:]
+
+    def as_dict(self) -> dict[str, Any]:
+        with self._lock:
+            statuses = [p["status"] for p in self.partitions.values()]
+            return {
+                "id": self.id,
+                "trigger": self.trigger,
+                "status": self.status,
+                "created_at": self.created_at.isoformat(),
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+                "elapsed": round(time.monotonic() - self._start, 1),
+                "progress": {
+                    "total": len(statuses),
+                    "done": sum(s in ("finished", "failed") for s in statuses),
+                    "failed": statuses.count("failed"),
+                },
+                "partitions": {name: dict(p) for name, p in self.partitions.items()},
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+def start_refresh(trigger: str = "manual", **options: Any) -> tuple[RefreshJob, bool]:
+    """
+    Start a refresh in the background unless one is already running.
+
+    `options` are passed to run_full_refresh. Returns (job, started):
+    the new job, or the running one with started=False.
+    """
+    global _running
+    with _lock:
+        if _running is not None:
+            return _running, False
+        job = _running = RefreshJob(trigger, options)
+        job.status = "running"
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_JOBS:
+            _jobs.popitem(last=False)
+
+    thread = threading.Thread(target=_run, args=(job,), name=f"refresh-{job.id}", daemon=True)
+    thread.start()
+    return job, True
+
+
+def get_job(job_id: str) -> RefreshJob | None:
+    return _jobs.get(job_id)
+
+
+def _run(job: RefreshJob) -> None:
+    global _running
+    # Imported lazily: the refresh pipeline pulls in the NLP and Places stacks
+    from refresh import run_full_refresh
+
+    status = "failed"
+    try:
+        job.result = run_full_refresh(progress=job.record, **job.options)
+        status = job.result["status"]
+    except Exception as e:
+        print(f"❌ Refresh job {job.id} failed: {e}")
+        job.error = str(e)
+    finally:
+        job.finished_at = datetime.now(timezone.utc)
+        with _lock:
+            _running = None
+        job.status = status  # last, so a finished job never blocks a new one
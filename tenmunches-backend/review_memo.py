@@ -0,0 +1,127 @@
+"""
+Persistent memo of per-review NLP results for TenMunches.
+
+Google returns mostly the same handful of reviews for a place week after
+week, so sentiment and theme results are memoized in a local SQLite file.
+Entries are keyed by a hash of the analyzer version and the review text
+and hold the polarity and integer theme counts. The file is trimmed to
+`max_entries` by least-recent use, and it is emptied whenever the stored
+analyzer version differs from the current one.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from sentiment import ANALYZER_VERSION
+
+load_dotenv()
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), ".cache", "review_memo.sqlite3")
+
+
+class ReviewMemo:
+    """SQLite-backed LRU memo of (polarity, theme counts) by review text."""
+
+    def __init__(
+        self,
+        path: str = DEFAULT_PATH,
+        max_entries: int = 200_000,
+        version: str = ANALYZER_VERSION,
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.version = version
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS memo ("
+                " key TEXT PRIMARY KEY,"
+                " sentiment REAL NOT NULL,"
+                " theme_counts TEXT NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS memo_lru ON memo (last_used)")
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None or row[0] != version:
+                self._conn.execute("DELETE FROM memo")
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+                    (version,),
+                )
+
+    @classmethod
+    def from_env(cls) -> "ReviewMemo | None":
+        """Open the memo at REVIEW_MEMO_PATH (None if set to an empty string)."""
+        path = os.getenv("REVIEW_MEMO_PATH", DEFAULT_PATH)
+        if not path:
+            return None
+        return cls(path, max_entries=int(os.getenv("REVIEW_MEMO_MAX_ENTRIES", "200000")))
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.version}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: list[str]) -> dict[str, tuple[float, list[int]]]:
+        """Return memoized results for `texts`, keyed by text."""
+        keys = {self.key(t): t for t in texts}
+        found: dict[str, tuple[float, list[int]]] = {}
+        now = time.time()
+        with self._lock, self._conn:
+            key_list = list(keys)
+            for i in range(0, len(key_list), 500):  # stay under SQLite's variable limit
+                batch = key_list[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, sentiment, theme_counts FROM memo WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, sentiment, counts in rows:
+                    found[keys[key]] = (sentiment, json.loads(counts))
+                self._conn.execute(
+                    f"UPDATE memo SET last_used = ? WHERE key IN ({placeholders})",
+                    [now, *batch],
+                )
+        return found
+
+    def put_many(self, results: dict[str, tuple[float, list[int]]]) -> None:
+        """Store results keyed by text, evicting least recently used entries."""
+        if not results:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO memo (key, sentiment, theme_counts, last_used)"
+                " VALUES (?, ?, ?, ?)",
+                [
+                    (self.key(text), sentiment, json.dumps(counts), now)
+                    for text, (sentiment, counts) in results.items()
+                ],
+            )
+            excess = self._conn.execute("SELECT COUNT(*) FROM memo").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM memo WHERE key IN"
+                    " (SELECT key FROM memo ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM memo").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
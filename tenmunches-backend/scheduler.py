@@ -3,6 +3,7 @@ Background scheduler for TenMunches.
 
 Runs the data refresh pipeline on a weekly schedule using APScheduler.
 Also triggers an initial refresh if the database is empty.
+Refreshes go through refresh_jobs.py, so they never overlap a manual one.
 """
 
 import threading
@@ -10,17 +11,16 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
 from db import get_all_categories
+from refresh_jobs import start_refresh
 
 _scheduler: BackgroundScheduler | None = None
 
 
 def _refresh_job() -> None:
-    """Run the full refresh pipeline (imported lazily to avoid circular imports)."""
-    from refresh import run_full_refresh
-    try:
-        run_full_refresh()
-    except Exception as e:
-        print(f"❌ Scheduled refresh failed: {e}")
+    """Start a background refresh job, unless one is already running."""
+    job, started = start_refresh("scheduled")
+    if not started:
+        print(f"⏭️ Refresh job {job.id} is already running, skipping scheduled refresh")
 
 
 def _initial_check() -> None:
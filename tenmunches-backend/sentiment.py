@@ -1,15 +1,25 @@
 """
 Sentiment analysis and theme extraction for TenMunches reviews.
 
-Uses TextBlob for polarity scoring and keyword-based theme detection.
+Uses TextBlob's sentiment lexicon for polarity scoring (batched through
+polarity.score_batch) and keyword-based theme detection.
+
+Themes are the THEME_KEYWORDS groups (taste, price, ambiance, service).
+The keyword groups are compiled once into a single regex automaton that
+scans a whole batch of reviews in one pass and returns integer-coded
+counts: one row per review, one column per theme (in THEMES order).
 """
 
+import hashlib
+import json
 import re
-from collections import Counter
 from typing import Any
 
+import numpy as np
 from textblob import TextBlob
 
+from polarity import score_batch
+
 # Theme keyword groups
 THEME_KEYWORDS = {
     "taste": ["flavor", "taste", "delicious", "bland", "spicy", "sweet", "savory"],
@@ -18,12 +28,36 @@ THEME_KEYWORDS = {
     "service": ["service", "staff", "friendly", "rude", "slow", "waiter", "manager"],
 }
 
-STOPWORDS = {
-    "the", "and", "was", "for", "with", "this", "that", "you", "your", "are", "but",
-    "not", "have", "they", "had", "from", "has", "it's", "its", "our", "been", "very",
-    "just", "too", "all", "out", "get", "who", "she", "he", "them", "some", "what",
-    "were", "also",
-}
+# Theme names indexed by their integer code
+THEMES = tuple(THEME_KEYWORDS)
+
+# Inflections a keyword may carry ("flavors", "priced", "slowly"). No "-ing":
+# it mostly turns keywords into other words ("staffing", "pricing").
+THEME_SUFFIX = r"(?:s|es|d|ed|ly|y)?"
+
+# Identifies the scoring rules; stored sentiment/theme results from another
+# version are discarded. Bump the prefix when the polarity rules change;
+# keyword and suffix edits change the hash automatically.
+ANALYZER_VERSION = "polarity-1/themes-" + hashlib.sha1(
+    json.dumps([THEME_KEYWORDS, THEME_SUFFIX], sort_keys=True).encode("utf-8")
+).hexdigest()[:8]
+
+
+def _compile_theme_matcher(groups: dict[str, list[str]]) -> re.Pattern:
+    """
+    Compile every keyword group into one case-insensitive regex with one
+    capture group per theme, so a match's `lastindex - 1` is its theme code.
+    Keywords match whole words, optionally with a THEME_SUFFIX inflection
+    ("flavors", "priced"), but not longer words ("dealer").
+    """
+    alternatives = [
+        "(" + "|".join(re.escape(k) for k in sorted(words, key=len, reverse=True)) + ")"
+        for words in groups.values()
+    ]
+    return re.compile(r"\b(?:" + "|".join(alternatives) + ")" + THEME_SUFFIX + r"\b", re.IGNORECASE)
+
+
+_THEME_RE = _compile_theme_matcher(THEME_KEYWORDS)
 
 
 def analyze_sentiment(text: str) -> float:
@@ -31,31 +65,75 @@ def analyze_sentiment(text: str) -> float:
     return TextBlob(text).sentiment.polarity
 
 
+def count_themes(texts: list[str]) -> np.ndarray:
+    """
+    Count theme keyword mentions for a batch of texts in one pass.
+
+    Returns an int32 array of shape (len(texts), len(THEMES)).
+    """
+    counts = np.zeros((len(texts), len(THEMES)), dtype=np.int32)
+    if not texts:
+        return counts
+
+    corpus = "\n".join(texts)
+    starts = np.cumsum([0] + [len(t) + 1 for t in texts[:-1]])
+    positions: list[int] = []
+    codes: list[int] = []
+    for m in _THEME_RE.finditer(corpus):
+        positions.append(m.start())
+        codes.append(m.lastindex - 1)
+
+    if positions:
+        docs = np.searchsorted(starts, positions, side="right") - 1
+        np.add.at(counts, (docs, codes), 1)
+    return counts
+
+
+def theme_names(row: np.ndarray | list[int]) -> list[str]:
+    """Themes present in a row of counts, most mentioned first."""
+    row = np.asarray(row)
+    order = np.argsort(-row, kind="stable")
+    return [THEMES[code] for code in order if row[code] > 0]
+
+
 def extract_themes(text: str) -> list[str]:
-    """Extract most common meaningful words from a review."""
-    words = re.findall(r"\b[a-zA-Z]{4,}\b", text.lower())
-    filtered = [w for w in words if w not in STOPWORDS]
-    counter = Counter(filtered)
-    return [w for w, _ in counter.most_common(5)]
+    """Return the themes a review mentions, most mentioned first."""
+    return theme_names(count_themes([text])[0])
 
 
 def process_reviews(reviews: list[dict[str, Any]]) -> list[dict[str, Any]]:
-    """Enrich each review with sentiment score and themes."""
-    enriched = []
-    for r in reviews:
-        text = r.get("text", "")
-        enriched.append({
-            **r,
-            "sentiment": analyze_sentiment(text),
-            "themes": extract_themes(text),
-        })
-    return enriched
-
-
-def summarize_themes(processed_reviews: list[dict[str, Any]]) -> dict[str, int]:
-    """Count theme frequency across all reviews."""
-    counts: dict[str, int] = {}
-    for r in processed_reviews:
-        for theme in r.get("themes", []):
-            counts[theme] = counts.get(theme, 0) + 1
-    return dict(sorted(counts.items(), key=lambda x: x[1], reverse=True))
+    """Enrich each review with sentiment score, themes and theme counts."""
+    texts = [r.get("text", "") for r in reviews]
+    polarities = score_batch(texts).tolist()
+    theme_counts = count_themes(texts)
+    return [
+        apply_scores(r, polarity, counts.tolist())
+        for r, polarity, counts in zip(reviews, polarities, theme_counts)
+    ]
+
+
+def apply_scores(
+    review: dict[str, Any],
+    polarity: float,
+    counts: list[int],
+) -> dict[str, Any]:
+    """Return a copy of `review` enriched with precomputed scores."""
+    return {
+        **review,
+        "sentiment": polarity,
+        "themes": theme_names(counts),
+        "theme_counts": counts,
+    }
+
+
+def summarize_themes(
+    processed_reviews: list[dict[str, Any]],
+    limit: int | None = None,
+) -> dict[str, int]:
+    """Count theme mentions across all reviews, most mentioned first (at most `limit`)."""
+    rows = [r["theme_counts"] for r in processed_reviews if "theme_counts" in r]
+    if not rows:
+        return {}
+    totals = np.sum(rows, axis=0)
+    order = [code for code in np.argsort(-totals, kind="stable") if totals[code] > 0]
+    return {THEMES[code]: int(totals[code]) for code in order[:limit]}
@@ -2,44 +2,47 @@
 FastAPI server for TenMunches.
 
 Serves category data from MongoDB with in-memory caching for speed.
+Endpoints are async and read through Motor (async_db.py), so a request
+waiting on MongoDB doesn't hold a worker thread.
 """
 
-import time
+import asyncio
 from contextlib import asynccontextmanager
-from typing import Any
+from typing import Any, AsyncIterator
 
-from fastapi import FastAPI, HTTPException
+import orjson
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-
-from db import get_all_categories, get_category, get_last_refresh, ping
+from fastapi.responses import StreamingResponse
+
+from api_cache import AsyncCache
+from async_db import get_all_categories, get_category, get_last_refresh, ping
+from cities import DEFAULT_CITY
+from cloudinary_service import thumbnail_url
+from db import HEAVY_FIELDS, SUMMARY_FIELDS, add_publish_listener, ensure_indexes, normalize_fields
+from payloads import EncodedPayload
+from refresh_jobs import RefreshJob, get_job, start_refresh
 from scheduler import start_scheduler
 
 # ---------------------------------------------------------------------------
-# In-memory cache (simple TTL cache for speed)
+# In-memory cache (bounded LRU, single-flight, stale-while-revalidate)
 # ---------------------------------------------------------------------------
+# Values are EncodedPayloads: JSON bytes + ETag + gzip/brotli variants, so a
+# hit is served without re-serializing anything; misses build them off the
+# event loop. Everything is invalidated as soon as a refresh in this process
+# publishes new data.
 
 CACHE_TTL = 300  # 5 minutes
+CACHE_STALE_TTL = 3600  # serve stale (while reloading) for up to an hour more
+CACHE_MAX_ENTRIES = 256
 
-_cache: dict[str, Any] = {}
-_cache_ts: dict[str, float] = {}
-
-
-def _cached(key: str) -> Any | None:
-    """Return cached value if not expired, else None."""
-    if key in _cache and (time.time() - _cache_ts.get(key, 0)) < CACHE_TTL:
-        return _cache[key]
-    return None
-
-
-def _set_cache(key: str, value: Any) -> None:
-    _cache[key] = value
-    _cache_ts[key] = time.time()
+_cache = AsyncCache(max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL)
+add_publish_listener(lambda city: _cache.invalidate())
 
 
 def invalidate_cache() -> None:
     """Clear the entire in-memory cache."""
-    _cache.clear()
-    _cache_ts.clear()
+    _cache.invalidate()
 
 
 # ---------------------------------------------------------------------------
@@ -48,7 +51,11 @@ def invalidate_cache() -> None:
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Start the background scheduler on app startup."""
+    """Create indexes and start the background scheduler on app startup."""
+    try:
+        await asyncio.to_thread(ensure_indexes)
+    except Exception as e:
+        print(f"⚠️ Could not create MongoDB indexes: {e}")
     start_scheduler()
     yield
 
@@ -78,10 +85,9 @@ app.add_middleware(
 # ---------------------------------------------------------------------------
 
 @app.get("/api/health")
-def health_check():
+async def health_check():
     """Health check + last refresh info."""
-    db_ok = ping()
-    last_refresh = get_last_refresh()
+    db_ok, last_refresh = await asyncio.gather(ping(), get_last_refresh())
     return {
         "status": "ok" if db_ok else "db_unreachable",
         "database": "connected" if db_ok else "disconnected",
@@ -89,52 +95,141 @@ def health_check():
     }
 
 
+async def _encode(data: Any) -> EncodedPayload:
+    """Build an EncodedPayload on a worker thread (compression takes CPU time)."""
+    return await asyncio.to_thread(EncodedPayload, data)
+
+
+def _parse_fields(fields: str | None) -> list[str] | None:
+    """Parse a comma-separated `fields=` parameter (None: all fields)."""
+    if fields is None:
+        return None
+    try:
+        return normalize_fields(f for f in fields.split(",") if f.strip())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _fields_key(fields: list[str] | None) -> str:
+    return ",".join(fields) if fields is not None else "*"
+
+
 @app.get("/api/categories")
-def list_categories():
+async def list_categories(
+    request: Request,
+    city: str = DEFAULT_CITY,
+    fields: str | None = None,
+) -> Response:
     """
-    Return all categories with their top_10 businesses.
+    Return all categories of a city with their top_10 businesses.
     This is the main endpoint the frontend fetches on load.
+
+    Heavy per-place fields (HEAVY_FIELDS, e.g. themes_summary) are left
+    out; /api/categories/{name} returns them. `fields` (comma-separated,
+    e.g. "category,top_10.name") returns only those fields instead; the
+    projection is applied by MongoDB.
     """
-    cached = _cached("all_categories")
-    if cached is not None:
-        return cached
+    projection = _parse_fields(fields)
 
-    data = get_all_categories()
-    if not data:
+    async def load() -> EncodedPayload | None:
+        data = await get_all_categories(city, fields=projection, exclude=HEAVY_FIELDS)
+        return await _encode(data) if data else None
+
+    payload = await _cache.get(f"all_categories:{city}:{_fields_key(projection)}", load)
+    if payload is None:
         raise HTTPException(
             status_code=503,
             detail="No data available. Run a refresh first.",
         )
-    _set_cache("all_categories", data)
-    return data
+    return payload.response(request)
+
+
+@app.get("/api/categories/summary")
+async def list_category_summaries(request: Request, city: str = DEFAULT_CITY) -> Response:
+    """
+    Return every category of a city with only the names, ratings and
+    thumbnail URLs of its top_10: enough to render the first screen.
+    """
+    async def load() -> EncodedPayload | None:
+        data = await get_all_categories(city, fields=SUMMARY_FIELDS)
+        for doc in data:
+            for biz in doc.get("top_10", []):
+                biz["thumbnail_url"] = thumbnail_url(biz.pop("photo_url", ""))
+        return await _encode(data) if data else None
+
+    payload = await _cache.get(f"summary:{city}", load)
+    if payload is None:
+        raise HTTPException(
+            status_code=503,
+            detail="No data available. Run a refresh first.",
+        )
+    return payload.response(request)
 
 
 @app.get("/api/categories/{name}")
-def get_single_category(name: str):
-    """Return a single category by name."""
-    cache_key = f"category:{name}"
-    cached = _cached(cache_key)
-    if cached is not None:
-        return cached
-
-    data = get_category(name)
-    if not data:
+async def get_single_category(
+    request: Request,
+    name: str,
+    city: str = DEFAULT_CITY,
+    fields: str | None = None,
+) -> Response:
+    """Return a single category of a city by name (only `fields`, if given)."""
+    projection = _parse_fields(fields)
+
+    async def load() -> EncodedPayload | None:
+        data = await get_category(name, city, fields=projection)
+        return await _encode(data) if data else None
+
+    payload = await _cache.get(f"category:{city}:{name}:{_fields_key(projection)}", load)
+    if payload is None:
         raise HTTPException(status_code=404, detail=f"Category '{name}' not found")
-    _set_cache(cache_key, data)
-    return data
+    return payload.response(request)
+
 
+@app.post("/api/refresh", status_code=202)
+async def trigger_refresh(response: Response) -> dict[str, Any]:
+    """
+    Start a data refresh in the background and return its job ID at once.
 
-@app.post("/api/refresh")
-def trigger_refresh():
+    Only one refresh runs at a time: while one is running, this returns
+    409 with the running job's ID instead of starting another.
     """
-    Manually trigger a data refresh.
-    Runs synchronously (can take several minutes).
+    job, started = start_refresh("manual")
+    if not started:
+        response.status_code = 409
+    response.headers["Location"] = f"/api/refresh/{job.id}"
+    return {"job_id": job.id, "status": job.status, "started": started}
+
+
+# Poll interval for streamed job progress
+JOB_POLL_INTERVAL = 0.5
+
+
+@app.get("/api/refresh/{job_id}")
+async def refresh_status(job_id: str, stream: bool = False) -> Any:
     """
-    from refresh import run_full_refresh
+    Return a refresh job's status with per-partition progress and timings.
 
-    invalidate_cache()
-    try:
-        run_full_refresh()
-        return {"status": "success", "message": "Data refresh completed"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    With ?stream=true, progress events are streamed as NDJSON as they
+    happen, ending with a {"event": "done"} line holding the final status.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Refresh job '{job_id}' not found")
+    if not stream:
+        return job.as_dict()
+    return StreamingResponse(_stream_job(job), media_type="application/x-ndjson")
+
+
+async def _stream_job(job: RefreshJob) -> AsyncIterator[bytes]:
+    seen = 0
+    while True:
+        done = job.done  # read before the events, so none are missed
+        events = job.events_since(seen)
+        seen += len(events)
+        for event in events:
+            yield orjson.dumps(event) + b"\n"
+        if done:
+            break
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+    yield orjson.dumps({"event": "done", "job": job.as_dict()}) + b"\n"
@@ -49,6 +49,84 @@ class TestMongoDB:
         result = get_all_categories()
         assert isinstance(result, list)
 
+    def test_indexes_and_projections(self):
+        from db import HEAVY_FIELDS, drop_all_categories, ensure_indexes, get_all_categories, get_db, upsert_category
+
+        ensure_indexes()
+        assert "city_snapshot_category" in get_db().categories.index_information()
+        assert "timestamp_ttl" in get_db().refresh_log.index_information()
+
+        city = "__test_city__"
+        try:
+            upsert_category({
+                "city": city,
+                "category": "a",
+                "top_10": [{"name": "X", "themes_summary": {"taste": 3}}],
+            })
+            light = get_all_categories(city, exclude=HEAVY_FIELDS)
+            assert light == [{"city": city, "category": "a", "top_10": [{"name": "X"}]}]
+            assert get_all_categories(city, fields=["category"]) == [{"category": "a"}]
+        finally:
+            drop_all_categories(city)
+
+    def test_snapshot_publish_and_rollback(self):
+        from db import (
+            drop_all_categories,
+            get_category,
+            new_snapshot_version,
+            publish_snapshot,
+            rollback_snapshot,
+            write_snapshot,
+        )
+
+        city = "__test_city__"
+        try:
+            v1 = new_snapshot_version()
+            write_snapshot(v1, [
+                {"city": city, "category": "a", "top_10": [1]},
+                {"city": city, "category": "b", "top_10": [1]},
+            ])
+            assert get_category("a", city) is None  # staged, not yet visible
+            assert publish_snapshot(city, v1, {"a", "b"}) is None
+
+            # A partial refresh carries the other categories over
+            v2 = new_snapshot_version()
+            write_snapshot(v2, [{"city": city, "category": "a", "top_10": [2]}])
+            assert publish_snapshot(city, v2, {"a"}) == v1
+            assert get_category("a", city)["top_10"] == [2]
+            assert get_category("b", city)["top_10"] == [1]
+
+            assert rollback_snapshot(city) == v1
+            assert get_category("a", city)["top_10"] == [1]
+        finally:
+            drop_all_categories(city)
+
+    def test_out_of_order_publish_keeps_active_snapshot(self):
+        from db import (
+            drop_all_categories,
+            get_active_snapshot,
+            get_category,
+            new_snapshot_version,
+            publish_snapshot,
+            write_snapshot,
+        )
+
+        city = "__test_city__"
+        try:
+            # Run A stages first, but run B publishes first
+            v_a = new_snapshot_version()
+            v_b = new_snapshot_version()
+            write_snapshot(v_a, [{"city": city, "category": "a", "top_10": ["A"]}])
+            write_snapshot(v_b, [{"city": city, "category": "b", "top_10": ["B"]}])
+            assert publish_snapshot(city, v_b, {"b"}) is None
+            assert publish_snapshot(city, v_a, {"a"}) == v_b
+
+            assert get_active_snapshot(city) == v_a
+            assert get_category("a", city)["top_10"] == ["A"]
+            assert get_category("b", city)["top_10"] == ["B"]
+        finally:
+            drop_all_categories(city)
+
 
 # ---------------------------------------------------------------------------
 # Cloudinary
@@ -100,6 +178,139 @@ class TestGooglePlaces:
         assert "displayName" in details or "rating" in details
 
 
+class TestAsyncPlacesClient:
+    def test_retries_and_preserves_order(self):
+        import asyncio
+
+        import httpx
+        from google_places import AsyncPlacesClient
+
+        calls: dict[str, int] = {}
+
+        def handler(request):
+            pid = request.url.path.rsplit("/", 1)[-1]
+            calls[pid] = calls.get(pid, 0) + 1
+            assert request.headers["X-Goog-Api-Key"] == "test"
+            if pid == "flaky" and calls[pid] == 1:
+                return httpx.Response(429, headers={"Retry-After": "0"})
+            if pid == "missing":
+                return httpx.Response(404, json={"error": {"message": "not found"}})
+            return httpx.Response(200, json={"id": pid})
+
+        async def run():
+            async with AsyncPlacesClient(
+                api_key="test", backoff=0, transport=httpx.MockTransport(handler),
+            ) as client:
+                return await client.get_many_details(["a", "flaky", "missing", "b"])
+
+        results = asyncio.run(run())
+        assert results == [{"id": "a"}, {"id": "flaky"}, {}, {"id": "b"}]
+        assert calls["flaky"] == 2
+        assert calls["missing"] == 1
+
+        # Retry-After is clamped; junk falls back to the backoff delay
+        from google_places import MAX_RETRY_AFTER, _retry_after
+
+        assert _retry_after(httpx.Response(429, headers={"Retry-After": "86400"}), 1.0) == MAX_RETRY_AFTER
+        assert _retry_after(httpx.Response(429, headers={"Retry-After": "nan"}), 1.0) == 1.0
+        assert _retry_after(httpx.Response(429), 1.0) == 1.0
+
+    def test_paginates_and_memoizes_details(self):
+        import asyncio
+        import json
+
+        import httpx
+        from google_places import AsyncPlacesClient
+
+        page_sizes: list[int] = []
+        detail_calls: list[str] = []
+
+        def handler(request):
+            if request.method == "POST":
+                body = json.loads(request.content)
+                page_sizes.append(body["pageSize"])
+                start = int(body.get("pageToken", "0"))
+                places = [{"id": f"p{start + i}"} for i in range(body["pageSize"])]
+                return httpx.Response(200, json={"places": places, "nextPageToken": str(start + 20)})
+            detail_calls.append(request.url.path)
+            return httpx.Response(200, json={"id": request.url.path.rsplit("/", 1)[-1]})
+
+        async def run():
+            async with AsyncPlacesClient(
+                api_key="test", transport=httpx.MockTransport(handler), memoize_details=True,
+            ) as client:
+                found = await client.search_places("ramen", max_results=45)
+                ids = [p["id"] for p in found]
+                await asyncio.gather(
+                    client.get_many_details(ids[:30]),
+                    client.get_many_details(ids[10:]),
+                )
+                return ids
+
+        ids = asyncio.run(run())
+        assert page_sizes == [20, 20, 5]
+        assert len(ids) == 45 and len(set(ids)) == 45
+        assert len(detail_calls) == 45
+
+
+class TestPlacesCache:
+    def test_roundtrip_ttl_and_replay(self, tmp_path):
+        import asyncio
+
+        import httpx
+        from google_places import DETAILS_FIELDS, DETAILS_URL, AsyncPlacesClient
+        from places_cache import ResponseCache
+
+        cache = ResponseCache(str(tmp_path), mode="on")
+        body = {"textQuery": "coffee in San Francisco"}
+        assert cache.get("search", "POST", "https://x/search", "places.id", body) is None
+
+        cache.put("search", "POST", "https://x/search", "places.id", body, {"places": [1]})
+        assert cache.get("search", "POST", "https://x/search", "places.id", body) == {"places": [1]}
+        # Field mask and body are part of the key
+        assert cache.get("search", "POST", "https://x/search", "places.name", body) is None
+
+        cache.put("details", "GET", f"{DETAILS_URL}a", DETAILS_FIELDS, None, {"id": "a"})
+        expired = ResponseCache(str(tmp_path), mode="on", ttls={"details": -1})
+        assert expired.get("details", "GET", f"{DETAILS_URL}a", DETAILS_FIELDS) is None
+
+        def offline(request):
+            raise AssertionError("replay mode must not touch the network")
+
+        # Replay ignores TTLs and turns misses into empty responses
+        replay = ResponseCache(str(tmp_path), mode="replay", ttls={"details": -1})
+
+        async def run():
+            async with AsyncPlacesClient(
+                api_key="", cache=replay, transport=httpx.MockTransport(offline),
+            ) as client:
+                return await client.get_many_details(["a", "b"])
+
+        assert asyncio.run(run()) == [{"id": "a"}, {}]
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        import time
+
+        from places_cache import ResponseCache
+
+        blob = {"data": os.urandom(2000).hex()}
+        probe = ResponseCache(str(tmp_path / "probe"), mode="on")
+        probe.put("details", "GET", "https://x/probe", "id", None, blob)
+        entry_size = os.path.getsize(probe._path(probe.key("GET", "https://x/probe", "id")))
+
+        cache = ResponseCache(str(tmp_path / "lru"), mode="on", max_bytes=int(entry_size * 3.5))
+        for i in range(3):
+            cache.put("details", "GET", f"https://x/{i}", "id", None, blob)
+            old = time.time() - 100 + i
+            os.utime(cache._path(cache.key("GET", f"https://x/{i}", "id")), (old, old))
+        # Touch the oldest entry so it becomes most recently used
+        assert cache.get("details", "GET", "https://x/0", "id") == blob
+
+        cache.put("details", "GET", "https://x/3", "id", None, blob)
+        remaining = {i for i in range(4) if cache.get("details", "GET", f"https://x/{i}", "id")}
+        assert remaining == {0, 2, 3}
+
+
 # ---------------------------------------------------------------------------
 # NLP Pipeline
 # ---------------------------------------------------------------------------
@@ -113,6 +324,43 @@ class TestSentiment:
         assert pos > 0, f"Expected positive sentiment, got {pos}"
         assert neg < 0, f"Expected negative sentiment, got {neg}"
 
+    def test_score_batch_matches_textblob(self):
+        import json
+
+        from polarity import POLARITY_TOLERANCE, score_batch
+        from textblob import TextBlob
+
+        corpus_path = os.path.join(
+            os.path.dirname(__file__), "..", "output", "top_places_photos_senti.json"
+        )
+        with open(corpus_path, encoding="utf-8") as f:
+            corpus = json.load(f)
+        texts = [
+            r["text"]
+            for category in corpus
+            for biz in category["top_10"]
+            for r in biz.get("reviews", [])
+        ]
+        texts += [
+            "",
+            "I'm not happy :( at all",
+            "Really not good!!!",
+            "This is (!) great",
+            "Don't go. Terrible.\n\nBut the staff :-) was nice",
+            "U.S. style at Mr. Smith's... amazing!",
+            "The food was NOT bad, very very good",
+        ]
+
+        expected = [TextBlob(t).sentiment.polarity for t in texts]
+        scores = score_batch(texts)
+        assert len(scores) == len(texts)
+        diffs = [abs(a - b) for a, b in zip(expected, scores)]
+        assert max(diffs) <= POLARITY_TOLERANCE
+
+        # Sharding across processes must not change results
+        sharded = score_batch(texts, workers=2)
+        assert sharded.tolist() == scores.tolist()
+
     def test_process_reviews(self):
         from sentiment import process_reviews
 
@@ -122,6 +370,94 @@ class TestSentiment:
         assert "sentiment" in result[0]
         assert "themes" in result[0]
 
+    def test_nlp_stage_preserves_order(self):
+        from nlp_stage import NLPStage
+
+        review_lists = [
+            [{"text": f"Review {i}-{j}: {'great' if (i + j) % 2 else 'awful'} service"} for j in range(i % 4)]
+            for i in range(30)
+        ]
+        with NLPStage(workers=1) as inline:
+            expected = inline.process(review_lists)
+        with NLPStage(workers=2, chunk_size=7) as stage:
+            result = stage.process(review_lists)
+        assert result == expected
+        assert [len(r) for r in result] == [len(r) for r in review_lists]
+
+    def test_nlp_stage_does_not_fork_threaded_process(self):
+        import threading
+
+        from nlp_stage import NLPStage
+
+        review_lists = [[{"text": "great service"}], [{"text": "awful food"}]]
+        with NLPStage(workers=1) as inline:
+            expected = inline.process(review_lists)
+
+        # Like a server-triggered refresh: built on a job thread
+        results = {}
+
+        def run():
+            with NLPStage(workers=2) as stage:
+                results["method"] = stage.start_method
+                results["reviews"] = stage.process(review_lists)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        assert results["method"] != "fork"
+        assert results["reviews"] == expected
+
+    def test_review_memo_skips_known_reviews(self, tmp_path, monkeypatch):
+        import nlp_stage
+        from nlp_stage import NLPStage
+        from review_memo import ReviewMemo
+
+        path = str(tmp_path / "memo.sqlite3")
+        review_lists = [[{"text": "Delicious and friendly"}, {"text": "Too slow"}], [{"text": "Cheap eats"}]]
+        with NLPStage(workers=1, memo=ReviewMemo(path)) as stage:
+            expected = stage.process(review_lists)
+
+        scored: list[str] = []
+        real_process = nlp_stage.process_reviews
+
+        def tracking(reviews):
+            scored.extend(r["text"] for r in reviews)
+            return real_process(reviews)
+
+        monkeypatch.setattr(nlp_stage, "process_reviews", tracking)
+        memo = ReviewMemo(path, max_entries=3)
+        with NLPStage(workers=1, memo=memo) as stage:
+            result = stage.process(review_lists + [[{"text": "Great vibe"}]])
+        assert result[:2] == expected
+        assert scored == ["Great vibe"]
+        assert len(memo) == 3  # least recently used entry evicted
+
+        # A new analyzer version starts from an empty memo
+        assert len(ReviewMemo(path, version="other")) == 0
+
+    def test_theme_counts_and_summary(self):
+        from sentiment import THEMES, count_themes, process_reviews, summarize_themes
+
+        texts = [
+            "Delicious flavors and a cozy vibe, but the staff was rude.",
+            "",
+            "Worth the price. Friendly service!",
+        ]
+        counts = count_themes(texts)
+        assert counts.shape == (3, len(THEMES))
+        by_theme = [dict(zip(THEMES, row.tolist())) for row in counts]
+        assert by_theme[0] == {"taste": 2, "price": 0, "ambiance": 2, "service": 2}
+        assert not counts[1].any()
+        assert by_theme[2] == {"taste": 0, "price": 2, "ambiance": 0, "service": 2}
+
+        processed = process_reviews([{"text": t} for t in texts])
+        assert processed[2]["themes"] == ["price", "service"]
+        assert summarize_themes(processed) == {"service": 4, "taste": 2, "ambiance": 2, "price": 2}
+
+        # Only inflections count, not longer words sharing a keyword prefix
+        assert not count_themes(["The dealer was staffing up", "Valuable servicemen"]).any()
+        assert count_themes(["Great deals, pricey, served slowly"]).tolist() == [[0, 2, 0, 1]]
+
 
 class TestRanker:
     def test_ranking(self):
@@ -136,6 +472,51 @@ class TestRanker:
         # B or C should be ranked higher than A
         assert ranked[0]["name"] != "A"
 
+    def test_vectorized_scores_match_reference(self):
+        import random
+
+        from ranker import compute_score, compute_scores, rank_businesses, to_columns
+
+        rng = random.Random(7)
+        businesses = [
+            {
+                "name": f"b{i}",
+                "rating": rng.choice([None, 3, 3.5, 4.2, 4.7, 5]),
+                "review_count": rng.choice([0, 50, 100, 101, 500, 501, 2000]),
+                "reviews": [
+                    {"sentiment": rng.choice([0, 0.5, rng.uniform(-1, 1)])}
+                    for _ in range(rng.randint(0, 7))
+                ],
+            }
+            for i in range(500)
+        ]
+        # Sequential summation would give 5.662 here, exact summation 5.663
+        businesses.append({
+            "name": "b500",
+            "rating": 4.7,
+            "review_count": 109,
+            "reviews": [{"sentiment": s} for s in (0.7, 0.2, 0.1, 0.7)],
+        })
+        expected = [compute_score(b) for b in businesses]
+        assert expected[-1] == 5.663
+        assert compute_scores(*to_columns(businesses)).tolist() == expected
+
+        # Ties keep input order, like a stable sort
+        ranked = rank_businesses(businesses)
+        by_name = {b["name"]: i for i, b in enumerate(businesses)}
+        reference = sorted(range(len(businesses)), key=lambda i: expected[i], reverse=True)
+        assert [by_name[b["name"]] for b in ranked] == reference
+
+    def test_top_k_matches_full_sort(self):
+        from ranker import rank_businesses, top_k
+
+        businesses = [
+            {"name": f"b{i}", "rating": 3.0 + (i * 7 % 5) / 2, "review_count": i * 40, "reviews": []}
+            for i in range(30)
+        ]
+        expected = [b["name"] for b in rank_businesses([dict(b) for b in businesses])[:10]]
+        assert [b["name"] for b in top_k(businesses, 10)] == expected
+
 
 class TestTestimonials:
     def test_select_testimonials(self):
@@ -151,6 +532,324 @@ class TestTestimonials:
         assert result[0] == "Amazing place!"
 
 
+class TestPhotoUploads:
+    def test_upload_photos_skips_existing(self, monkeypatch):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+
+        import cloudinary_service
+        from rate_limit import TokenBucket
+
+        base = "https://res.cloudinary.com/demo/image/upload/v1/tenmunches"
+        lookups: list[list[str]] = []
+        uploaded: list[str] = []
+        lock = threading.Lock()
+
+        def resources_by_ids(public_ids, **kwargs):
+            lookups.append(public_ids)
+            return {"resources": [
+                {"public_id": p, "secure_url": f"{base}/{p.rsplit('/', 1)[-1]}.jpg"}
+                for p in public_ids if int(p.rsplit("p", 1)[-1]) % 2 == 0
+            ]}
+
+        def upload(url, public_id, **kwargs):
+            with lock:
+                uploaded.append(public_id)
+            return {"secure_url": f"{base}/{public_id.rsplit('/', 1)[-1]}.jpg"}
+
+        monkeypatch.setattr(cloudinary_service, "LOOKUP_BATCH_SIZE", 4)
+        monkeypatch.setattr(cloudinary_service.cloudinary.api, "resources_by_ids", resources_by_ids)
+        monkeypatch.setattr(cloudinary_service.cloudinary.uploader, "upload", upload)
+
+        photos = {f"p{i}": f"https://places.test/p{i}.jpg" for i in range(10)}
+        photos["bad"] = "not-a-url"
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            urls = cloudinary_service.upload_photos(photos, pool, TokenBucket(1000))
+
+        assert [len(batch) for batch in lookups] == [4, 4, 2]
+        assert sorted(uploaded) == sorted(f"tenmunches/p{i}" for i in range(1, 10, 2))
+        assert set(urls) == {f"p{i}" for i in range(10)}
+        assert urls["p3"] == "https://res.cloudinary.com/demo/image/upload/f_auto,q_auto/v1/tenmunches/p3.jpg"
+
+    def test_token_bucket_limits_rate(self):
+        import time
+
+        from rate_limit import TokenBucket
+
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        assert time.monotonic() - start >= 0.09
+        assert TokenBucket(0).acquire(100) == 0.0
+
+
+# ---------------------------------------------------------------------------
+# Refresh pipeline
+# ---------------------------------------------------------------------------
+
+class TestStreamingPipeline:
+    def test_stages_backpressure_and_stats(self):
+        import time
+
+        from pipeline import Pipeline
+
+        produced = [0]
+
+        def source():
+            for i in range(50):
+                produced[0] += 1
+                yield i
+
+        pipeline = (
+            Pipeline(maxsize=2)
+            .add("double", lambda x: x * 2)
+            .add("inc", lambda x: x + 1)
+        )
+        out = []
+        for item in pipeline.run(source()):
+            # The source can only run a bounded distance ahead of a slow consumer
+            assert produced[0] - len(out) <= 2 * 3 + 4
+            time.sleep(0.001)
+            out.append(item)
+
+        assert out == [i * 2 + 1 for i in range(50)]
+        stats = {name: s.as_dict() for name, s in pipeline.stats.items()}
+        assert stats["double"]["items"] == stats["inc"]["items"] == 50
+        assert all(s["max_queue_depth"] <= 2 for s in stats.values())
+
+        # Returning None drops an item
+        inline = Pipeline(threaded=False).add("even", lambda x: x if x % 2 == 0 else None)
+        assert list(inline.run(range(5))) == [0, 2, 4]
+
+    def test_stage_error_propagates(self):
+        from pipeline import Pipeline
+
+        def fail(x):
+            if x == 3:
+                raise ValueError("boom")
+            return x
+
+        pipeline = Pipeline(maxsize=1).add("fail", fail).add("noop", lambda x: x)
+        with pytest.raises(ValueError, match="boom"):
+            list(pipeline.run(range(100)))
+
+
+class TestCities:
+    def test_partitions_interleave_cities(self, monkeypatch):
+        import cities
+
+        monkeypatch.setitem(cities.CITIES, "testville", {"name": "Testville", "categories": ["pie"]})
+        parts = cities.partitions(["san-francisco", "testville"])
+        assert parts[:3] == [("san-francisco", "coffee"), ("testville", "pie"), ("san-francisco", "pizza")]
+        assert len(parts) == len(cities.CATEGORIES) + 1
+        with pytest.raises(ValueError):
+            cities.partitions(["atlantis"])
+
+    def test_shards_cover_every_partition_once(self):
+        import cities
+
+        parts = cities.partitions(["san-francisco", "oakland"])
+        shards = [cities.shard(parts, i, 3) for i in range(3)]
+        assert sorted(p for s in shards for p in s) == sorted(parts)
+        assert all(shards)  # 40 partitions over 3 shards: none left empty
+        assert cities.shard(parts, 1, 3) == shards[1]  # stable
+        assert cities.parse_shard("1/3") == (1, 3)
+
+
+class TestRefresh:
+    @pytest.fixture
+    def stub_services(self, monkeypatch, tmp_path):
+        """Replace network-bound services with in-memory fakes."""
+        monkeypatch.setenv("REVIEW_MEMO_PATH", str(tmp_path / "memo.sqlite3"))
+        monkeypatch.setenv("PHOTO_INDEX_PATH", str(tmp_path / "photo_index.json"))
+        import functools
+        import json
+
+        import httpx
+        import refresh
+        from google_places import AsyncPlacesClient
+
+        def fake_details(pid):
+            return {
+                "id": pid,
+                "displayName": {"text": pid.upper()},
+                "rating": 4.0 + int(pid[1:]) / 100,
+                "userRatingCount": 150,
+                "photos": [{"name": f"places/{pid}/photos/1"}],
+                "reviews": [{"rating": 5, "text": {"text": "Great food, friendly staff!"}}],
+            }
+
+        # Two search pages; the second repeats a place from the first
+        pages = [
+            [{"id": f"p{i}"} for i in range(7)],
+            [{"id": f"p{i}"} for i in range(7, 12)] + [{"id": "p0"}],
+        ]
+
+        def handler(request):
+            if request.method == "POST":
+                token = json.loads(request.content).get("pageToken")
+                if token:
+                    return httpx.Response(200, json={"places": pages[1]})
+                return httpx.Response(200, json={"places": pages[0], "nextPageToken": "t1"})
+            return httpx.Response(200, json=fake_details(request.url.path.rsplit("/", 1)[-1]))
+
+        transport = httpx.MockTransport(handler)
+        store: dict[str, dict] = {}
+        monkeypatch.setattr(refresh, "iter_search_pages", lambda q, location: iter(pages))
+        monkeypatch.setattr(refresh, "get_place_details", fake_details)
+        monkeypatch.setattr(
+            refresh, "get_place_snapshots", lambda ids: {i: store[i] for i in ids if i in store}
+        )
+        monkeypatch.setattr(
+            refresh, "upsert_place_snapshots", lambda docs: store.update({d["id"]: d for d in docs})
+        )
+        monkeypatch.setattr(
+            refresh,
+            "AsyncPlacesClient",
+            functools.partial(AsyncPlacesClient, api_key="test", transport=transport),
+        )
+        uploads: list[tuple[list[str], list[str]]] = []
+
+        def fake_upload_photos(photos, executor=None, limiter=None, replace=()):
+            uploads.append((sorted(photos), sorted(replace)))
+            return {pid: f"https://cdn.test/{pid}.jpg" for pid in photos}
+
+        fake_upload_photos.calls = uploads
+        monkeypatch.setattr(refresh, "upload_photos", fake_upload_photos)
+        return refresh
+
+    def test_process_category_with_pools(self, stub_services):
+        refresh = stub_services
+        with refresh.RefreshPools(details_workers=4, upload_workers=4, nlp_workers=2) as pools:
+            data = refresh.process_category("coffee", pools)
+
+        top_10 = data["top_10"]
+        assert data["category"] == "coffee"
+        assert data["city"] == "san-francisco"
+        assert len(top_10) == 10
+        # Duplicate search hits are fetched once; ranking keeps highest rating first
+        assert len({b["id"] for b in top_10}) == 10
+        assert top_10[0]["id"] == "p11"
+        assert top_10[0]["photo_url"] == "https://cdn.test/p11.jpg"
+        assert top_10[0]["testimonials"] == ["Great food, friendly staff!"]
+        assert "reviews" not in top_10[0]
+
+    def test_full_refresh_publishes_one_snapshot(self, stub_services, monkeypatch):
+        import cities
+
+        refresh = stub_services
+        monkeypatch.setitem(cities.CITIES, "testville", {"name": "Testville", "categories": ["coffee", "tea"]})
+        writes: list[tuple[str, list[dict]]] = []
+        published: list[tuple[str, str, set[str]]] = []
+        monkeypatch.setattr(refresh, "ensure_indexes", lambda: None)
+        monkeypatch.setattr(refresh, "log_refresh", lambda status, details: None)
+        monkeypatch.setattr(refresh, "new_snapshot_version", lambda: "v1")
+        monkeypatch.setattr(refresh, "write_snapshot", lambda v, docs: writes.append((v, docs)))
+        monkeypatch.setattr(
+            refresh, "publish_snapshot", lambda city, v, cats: published.append((city, v, cats))
+        )
+
+        refresh.run_full_refresh(category_workers=2, cities=["testville"], shard_spec="")
+        assert len(writes) == 1
+        assert sorted(d["category"] for d in writes[0][1]) == ["coffee", "tea"]
+        assert published == [("testville", "v1", {"coffee", "tea"})]
+
+    def test_nlp_workers_fork_before_mongo_threads(self, stub_services, monkeypatch):
+        import threading
+
+        import cities
+        import nlp_stage
+
+        refresh = stub_services
+        monkeypatch.setitem(cities.CITIES, "testville", {"name": "Testville", "categories": ["coffee"]})
+        stages = []
+
+        class SpyStage(refresh.NLPStage):
+            def __init__(self, workers, **kwargs):
+                super().__init__(2, **kwargs)
+                stages.append(self)
+
+        # Like MongoClient: connecting starts monitor threads
+        stop = threading.Event()
+
+        def fake_ensure_indexes():
+            threading.Thread(target=stop.wait, daemon=True).start()
+
+        monkeypatch.setattr(refresh, "NLPStage", SpyStage)
+        monkeypatch.setattr(refresh, "ensure_indexes", fake_ensure_indexes)
+        monkeypatch.setattr(refresh, "log_refresh", lambda status, details: None)
+        monkeypatch.setattr(refresh, "write_snapshot", lambda v, docs: None)
+        monkeypatch.setattr(refresh, "publish_snapshot", lambda city, v, cats: None)
+        # Count only threads started by the refresh, as in a fresh process
+        active_count = threading.active_count
+        baseline = active_count() - 1
+        monkeypatch.setattr(nlp_stage.threading, "active_count", lambda: active_count() - baseline)
+        try:
+            result = refresh.run_full_refresh(cities=["testville"], shard_spec="")
+        finally:
+            stop.set()
+        assert result["status"] == "success"
+        assert [stage.start_method for stage in stages] == ["fork"]
+
+    def test_serial_matches_pooled(self, stub_services):
+        refresh = stub_services
+        serial = refresh.process_category("coffee", incremental=False)
+        with refresh.RefreshPools(details_workers=3, upload_workers=2, nlp_workers=1) as pools:
+            pooled = refresh.process_category("coffee", pools, incremental=False)
+        assert serial == pooled
+
+    def test_incremental_reuses_unchanged_places(self, stub_services, monkeypatch):
+        refresh = stub_services
+        first = refresh.process_category("coffee")
+
+        fetched: list[str] = []
+        real_details = refresh.get_place_details
+
+        def counting_details(pid):
+            fetched.append(pid)
+            return real_details(pid)
+
+        monkeypatch.setattr(refresh, "get_place_details", counting_details)
+        # Search hits now carry the stored rating/count for every place but one
+        hits = [
+            {"id": f"p{i}", "rating": 4.0 + i / 100, "userRatingCount": 150}
+            for i in range(12)
+        ]
+        hits[3]["userRatingCount"] = 151
+        monkeypatch.setattr(refresh, "iter_search_pages", lambda q, location: iter([hits]))
+
+        second = refresh.process_category("coffee")
+        assert fetched == ["p3"]
+        assert second == first
+
+    def test_photo_index_skips_unchanged_photos(self, stub_services, tmp_path):
+        refresh = stub_services
+        calls = refresh.upload_photos.calls
+        with refresh.RefreshPools(details_workers=4, upload_workers=2, nlp_workers=1) as pools:
+            refresh.process_category("coffee", pools, incremental=False)
+            # Only the top 10 of the 12 candidates get a photo upload
+            assert calls[0][0] == sorted(f"p{i}" for i in range(2, 12))
+            assert not any(replaced for _, replaced in calls)
+
+            # Same photo references: resolved from the index, nothing uploaded
+            calls.clear()
+            refresh.process_category("coffee", pools, incremental=False)
+            assert calls == []
+
+            # A changed reference is re-uploaded, replacing the stored image
+            pools.photos.update({"p4": ("places/p4/photos/old", "https://cdn.test/old.jpg")})
+            data = refresh.process_category("coffee", pools, incremental=False)
+            assert calls == [(["p4"], ["p4"])]
+            assert all(b["photo_url"] == f"https://cdn.test/{b['id']}.jpg" for b in data["top_10"])
+
+        from photo_index import PhotoIndex
+
+        saved = PhotoIndex(str(tmp_path / "photo_index.json"))
+        assert len(saved) == 10
+        assert saved.get("p4", "places/p4/photos/1") == "https://cdn.test/p4.jpg"
+
+
 # ---------------------------------------------------------------------------
 # API Server
 # ---------------------------------------------------------------------------
@@ -180,3 +879,476 @@ class TestAPI:
     def test_category_not_found(self):
         resp = self._client.get("/api/categories/__nonexistent__")
         assert resp.status_code == 404
+
+
+class TestAsyncDB:
+    @pytest.fixture
+    def fake_db(self, monkeypatch):
+        """Stub Motor collections: one city with an active snapshot."""
+        from types import SimpleNamespace
+
+        import async_db
+
+        calls = []
+        docs = [{"city": "sf", "category": "coffee", "top_10": [{"name": "X"}]}]
+
+        class Cursor:
+            def __init__(self, found):
+                self.found = found
+
+            async def to_list(self, length=None):
+                return self.found
+
+        class Snapshots:
+            async def find_one(self, query, projection=None):
+                return {"_id": "sf", "active": "v2"} if query["_id"] == "sf" else None
+
+        class Categories:
+            def find(self, query, projection):
+                calls.append(("find", query, projection))
+                return Cursor([dict(d) for d in docs])
+
+            async def find_one(self, query, projection):
+                calls.append(("find_one", query, projection))
+                return next((dict(d) for d in docs if d["category"] == query["category"]), None)
+
+        db = SimpleNamespace(snapshots=Snapshots(), categories=Categories())
+        monkeypatch.setattr(async_db, "get_db", lambda: db)
+        return calls
+
+    def test_reads_active_snapshot_with_projection(self, fake_db):
+        import asyncio
+
+        from async_db import get_all_categories, get_category
+        from db import HEAVY_FIELDS
+
+        async def run():
+            return (
+                await get_all_categories("sf", exclude=HEAVY_FIELDS),
+                await get_category("coffee", "sf", fields=["category"]),
+            )
+
+        docs, doc = asyncio.run(run())
+        assert docs[0]["category"] == "coffee"
+        assert doc["category"] == "coffee"
+        assert fake_db == [
+            ("find", {"city": "sf", "snapshot": "v2"},
+             {"_id": 0, "snapshot": 0, "top_10.themes_summary": 0}),
+            ("find_one", {"city": "sf", "snapshot": "v2", "category": "coffee"},
+             {"_id": 0, "category": 1}),
+        ]
+
+    def test_city_without_snapshot(self, fake_db):
+        import asyncio
+
+        from async_db import get_all_categories, get_category
+
+        async def run():
+            return await get_all_categories("nyc"), await get_category("coffee", "nyc")
+
+        assert asyncio.run(run()) == ([], None)
+        assert fake_db == []  # no category query without an active snapshot
+
+
+class TestEncodedResponses:
+    @pytest.fixture
+    def client(self, monkeypatch):
+        from fastapi.testclient import TestClient
+        import server as srv
+
+        calls = []
+
+        async def fake_get_all_categories(city, fields=None, exclude=()):
+            calls.append(city)
+            return [{"city": city, "category": "coffee", "top_10": [{"name": "x" * 2000}]}]
+
+        monkeypatch.setattr(srv, "get_all_categories", fake_get_all_categories)
+        srv.invalidate_cache()
+        yield TestClient(srv.app), calls
+        srv.invalidate_cache()
+
+    def test_etag_and_compressed_variants(self, client):
+        client, calls = client
+        plain = client.get("/api/categories", headers={"Accept-Encoding": "identity"})
+        assert plain.status_code == 200
+        etag = plain.headers["etag"]
+        assert plain.json()[0]["category"] == "coffee"
+
+        br = client.get("/api/categories", headers={"Accept-Encoding": "gzip, br"})
+        assert br.headers["content-encoding"] == "br"
+        assert br.headers["etag"] == etag
+        gz = client.get("/api/categories", headers={"Accept-Encoding": "gzip, br;q=0"})
+        assert gz.headers["content-encoding"] == "gzip"
+        assert gz.json() == plain.json()  # httpx decodes both transparently
+
+        not_modified = client.get("/api/categories", headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        assert calls == ["san-francisco"]  # every hit after the first came from the cache
+
+
+class TestAsyncCache:
+    @staticmethod
+    def _loader(calls, value="v", delay=0.0):
+        import asyncio
+
+        async def load():
+            calls.append(value)
+            await asyncio.sleep(delay)
+            return value
+        return load
+
+    def test_concurrent_misses_share_one_load(self):
+        import asyncio
+        from api_cache import AsyncCache
+
+        async def run():
+            cache, calls = AsyncCache(), []
+            values = await asyncio.gather(
+                *(cache.get("k", self._loader(calls, delay=0.01)) for _ in range(20))
+            )
+            return values, calls
+
+        values, calls = asyncio.run(run())
+        assert values == ["v"] * 20
+        assert calls == ["v"]
+
+    def test_lru_bound(self):
+        import asyncio
+        from api_cache import AsyncCache
+
+        async def run():
+            cache, calls = AsyncCache(max_entries=2), []
+            await cache.get("a", self._loader(calls, "a"))
+            await cache.get("b", self._loader(calls, "b"))
+            await cache.get("a", self._loader(calls, "a"))  # hit; "b" is now oldest
+            await cache.get("c", self._loader(calls, "c"))  # evicts "b"
+            await cache.get("a", self._loader(calls, "a"))
+            await cache.get("b", self._loader(calls, "b"))
+            return cache, calls
+
+        cache, calls = asyncio.run(run())
+        assert calls == ["a", "b", "c", "b"]
+        assert len(cache) == 2
+
+    def test_stale_while_revalidate_and_invalidate(self):
+        import asyncio
+        from api_cache import AsyncCache
+
+        async def run():
+            cache, calls = AsyncCache(ttl=0, stale_ttl=60), []
+            first = await cache.get("k", self._loader(calls, "old"))
+            stale = await cache.get("k", self._loader(calls, "new"))  # served stale, reloads
+            await asyncio.sleep(0.01)
+            cache.ttl = 60
+            fresh = await cache.get("k", self._loader(calls, "unused"))
+            cache.invalidate()
+            reloaded = await cache.get("k", self._loader(calls, "after"))
+            return [first, stale, fresh, reloaded], calls
+
+        values, calls = asyncio.run(run())
+        assert values == ["old", "old", "new", "after"]
+        assert calls == ["old", "new", "after"]
+
+
+class TestRefreshJobs:
+    @pytest.fixture
+    def fake_refresh(self, monkeypatch):
+        """A run_full_refresh that reports progress and blocks until released."""
+        import threading
+
+        import refresh
+
+        release = threading.Event()
+        runs: list[dict] = []
+
+        def fake_run_full_refresh(progress=None, **options):
+            runs.append(options)
+            progress({"event": "planned", "partitions": ["sf/coffee", "sf/tea"]})
+            progress({"event": "started", "city": "sf", "category": "coffee"})
+            progress({"event": "finished", "city": "sf", "category": "coffee", "seconds": 0.1, "places": 10})
+            release.wait(5)
+            progress({"event": "started", "city": "sf", "category": "tea"})
+            progress({"event": "failed", "city": "sf", "category": "tea", "seconds": 0.2, "error": "boom"})
+            return {"status": "partial", "snapshot": "v1", "seconds": 0.3, "errors": ["boom"]}
+
+        monkeypatch.setattr(refresh, "run_full_refresh", fake_run_full_refresh)
+        yield release, runs
+        release.set()
+
+    def test_single_flight_job_progress(self, fake_refresh):
+        import time
+
+        import refresh_jobs
+
+        release, runs = fake_refresh
+        job, started = refresh_jobs.start_refresh("manual")
+        again, started_again = refresh_jobs.start_refresh("scheduled")
+        assert started and not started_again
+        assert again is job
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while not job.done and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        status = refresh_jobs.get_job(job.id).as_dict()
+        assert len(runs) == 1
+        assert status["status"] == "partial"
+        assert status["progress"] == {"total": 2, "done": 2, "failed": 1}
+        assert status["partitions"]["sf/coffee"] == {"status": "finished", "seconds": 0.1, "places": 10}
+        assert status["partitions"]["sf/tea"]["error"] == "boom"
+
+        # Once finished, a new refresh can start
+        next_job, started = refresh_jobs.start_refresh("manual")
+        assert started and next_job is not job
+        while not next_job.done and time.monotonic() < deadline + 5:
+            time.sleep(0.01)
+
+    def test_endpoints_return_job_at_once(self, fake_refresh):
+        import json
+        import time
+
+        from fastapi.testclient import TestClient
+        import server as srv
+
+        release, _ = fake_refresh
+        client = TestClient(srv.app)
+        resp = client.post("/api/refresh")
+        assert resp.status_code == 202
+        job_id = resp.json()["job_id"]
+        assert resp.headers["location"] == f"/api/refresh/{job_id}"
+        assert client.post("/api/refresh").status_code == 409
+
+        deadline = time.monotonic() + 5
+        running = client.get(f"/api/refresh/{job_id}").json()
+        while running["progress"]["done"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+            running = client.get(f"/api/refresh/{job_id}").json()
+        assert running["status"] == "running"
+        assert running["partitions"]["sf/coffee"]["status"] == "finished"
+
+        release.set()
+        lines = [json.loads(l) for l in client.get(f"/api/refresh/{job_id}?stream=true").iter_lines()]
+        assert [e["event"] for e in lines][-3:] == ["started", "failed", "done"]
+        assert lines[-1]["job"]["status"] == "partial"
+        assert client.get("/api/refresh/nope").status_code == 404
+
+
+class TestCategoryProjections:
+    @pytest.fixture
+    def client(self, monkeypatch):
+        from fastapi.testclient import TestClient
+        import server as srv
+
+        calls = []
+        doc = {
+            "city": "san-francisco",
+            "category": "coffee",
+            "top_10": [{
+                "name": "Sightglass",
+                "rating": 4.6,
+                "photo_url": "https://res.cloudinary.com/demo/image/upload/f_auto,q_auto/v1/tenmunches/p1.jpg",
+            }],
+        }
+
+        async def fake_get_all_categories(city, fields=None, exclude=()):
+            calls.append(fields if fields is not None else exclude)
+            return [{**doc, "top_10": [dict(b) for b in doc["top_10"]]}]
+
+        async def fake_get_category(name, city, fields=None):
+            calls.append(fields)
+            return dict(doc)
+
+        monkeypatch.setattr(srv, "get_all_categories", fake_get_all_categories)
+        monkeypatch.setattr(srv, "get_category", fake_get_category)
+        srv.invalidate_cache()
+        yield TestClient(srv.app), calls
+        srv.invalidate_cache()
+
+    def test_summary_endpoint(self, client):
+        from db import SUMMARY_FIELDS
+
+        client, calls = client
+        resp = client.get("/api/categories/summary")
+        assert resp.status_code == 200
+        biz = resp.json()[0]["top_10"][0]
+        assert "photo_url" not in biz
+        assert biz["thumbnail_url"] == (
+            "https://res.cloudinary.com/demo/image/upload/c_fill,w_320,h_320,f_auto,q_auto/v1/tenmunches/p1.jpg"
+        )
+        assert calls == [SUMMARY_FIELDS]
+
+    def test_fields_pushed_down_and_validated(self, client):
+        from db import HEAVY_FIELDS
+
+        client, calls = client
+        assert client.get("/api/categories?fields=top_10.name,category,top_10").status_code == 200
+        assert client.get("/api/categories/coffee?fields=category").status_code == 200
+        assert client.get("/api/categories").status_code == 200
+        # Each projection is cached separately
+        assert client.get("/api/categories?fields=category,top_10").status_code == 200
+        assert calls == [["category", "top_10"], ["category"], HEAVY_FIELDS]
+        assert client.get("/api/categories?fields=$where").status_code == 400
+        assert client.get("/api/categories/coffee?fields=_id").status_code == 400
+        assert client.get("/api/categories?fields=").status_code == 400
+        assert client.get("/api/categories/coffee?fields=,").status_code == 400
+
+    def test_themes_summary_cap(self):
+        from sentiment import process_reviews, summarize_themes
+
+        processed = process_reviews([
+            {"text": "Friendly staff, great service, delicious flavor, cozy vibe, fair price"},
+        ])
+        assert len(summarize_themes(processed)) == 4
+        assert list(summarize_themes(processed, limit=2)) == list(summarize_themes(processed))[:2]
+
+
+class TestStaticExport:
+    def test_unchanged_shards_are_kept(self, monkeypatch, tmp_path):
+        import gzip
+
+        import export_data
+
+        docs = [
+            {"city": "san-francisco", "category": "coffee", "top_10": [{"name": "A"}]},
+            {"city": "san-francisco", "category": "ice cream", "top_10": [{"name": "B"}]},
+        ]
+        monkeypatch.setattr(
+            export_data, "iter_categories", lambda city, batch_size: (dict(d) for d in docs)
+        )
+        shard_dir = tmp_path / "shards"
+
+        first = export_data.export_shards(str(tmp_path))
+        files = {e["category"]: e["file"] for e in first["categories"]}
+        assert files["ice cream"].startswith("shards/ice-cream.")
+        path = tmp_path / files["coffee"]
+        assert gzip.decompress((tmp_path / (files["coffee"] + ".gz")).read_bytes()) == path.read_bytes()
+        mtime = path.stat().st_mtime_ns
+
+        # Unchanged content: same names, nothing rewritten
+        assert export_data.export_shards(str(tmp_path)) == first
+        assert path.stat().st_mtime_ns == mtime
+
+        # One category changes: only its shard gets a new name; the previous
+        # manifest's shard is kept for one more export, then pruned
+        docs[1]["top_10"] = [{"name": "C"}]
+        second = export_data.export_shards(str(tmp_path))
+        assert second["categories"][0] == first["categories"][0]
+        assert second["categories"][1]["file"] != files["ice cream"]
+        assert (tmp_path / files["ice cream"]).exists()
+        export_data.export_shards(str(tmp_path))
+        assert not (tmp_path / files["ice cream"]).exists()
+        assert len([n for n in os.listdir(shard_dir) if n.endswith(".json")]) == 2
+
+    def test_streaming_export_is_atomic(self, monkeypatch, tmp_path):
+        import json
+
+        import export_data
+
+        docs = [{"category": c, "top_10": [{"name": "café"}]} for c in ("bakery", "coffee")]
+        monkeypatch.setattr(export_data, "iter_categories", lambda city, batch_size: iter(docs))
+        path = tmp_path / "categories.json"
+        assert export_data.export_categories(str(path)) == 2
+        assert json.loads(path.read_text(encoding="utf-8")) == docs
+
+        ndjson = tmp_path / "categories.ndjson"
+        export_data.export_categories(str(ndjson), ndjson=True)
+        assert [json.loads(line) for line in ndjson.read_text(encoding="utf-8").splitlines()] == docs
+
+        # A failure mid-stream keeps the previous file and leaves no temp file
+        def failing(city, batch_size):
+            yield docs[0]
+            raise RuntimeError("cursor died")
+
+        monkeypatch.setattr(export_data, "iter_categories", failing)
+        with pytest.raises(RuntimeError):
+            export_data.export_categories(str(path))
+        assert json.loads(path.read_text(encoding="utf-8")) == docs
+        assert sorted(os.listdir(tmp_path)) == ["categories.json", "categories.ndjson"]
+
+
+class TestBatchSummarizer:
+    @pytest.fixture
+    def gemini(self, monkeypatch):
+        import gemini_summarizer as gs
+        from rate_limit import TokenBucket
+
+        sleeps: list[float] = []
+        monkeypatch.setattr(gs, "client", object())
+        monkeypatch.setattr(gs, "_request_limiter", TokenBucket(0))
+        monkeypatch.setattr(gs, "_token_limiter", TokenBucket(0))
+        monkeypatch.setattr(gs.time, "sleep", sleeps.append)
+        return gs, sleeps
+
+    @staticmethod
+    def _places(n):
+        return [
+            {"id": f"p{i}", "name": f"Place {i}", "reviews": [{"rating": 5, "text": "Great croissants"}]}
+            for i in range(n)
+        ]
+
+    def test_batches_places_into_one_prompt(self, gemini, monkeypatch):
+        import json
+
+        gs, _ = gemini
+        prompts = []
+
+        def fake_generate(prompt, max_output_tokens):
+            prompts.append(prompt)
+            ids = [line.split("id: ")[1].split(" |")[0] for line in prompt.splitlines() if "=== id:" in line]
+            return json.dumps([{"id": pid, "summary": f'"Known for {pid}"'} for pid in ids])
+
+        monkeypatch.setattr(gs, "_generate", fake_generate)
+        places = self._places(25) + [{"id": "quiet", "name": "Quiet", "reviews": []}]
+        summaries = gs.summarize_places(places, "bakery", batch_size=10)
+        assert len(prompts) == 3
+        assert summaries["p24"] == "Known for p24"
+        assert "quiet" not in summaries and len(summaries) == 25
+
+    def test_retry_follows_server_hint(self, gemini, monkeypatch):
+        import json
+
+        gs, sleeps = gemini
+
+        class RateLimited(Exception):
+            code = 429
+            details = {"error": {"details": [
+                {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "7s"},
+            ]}}
+
+        responses = [RateLimited("quota"), "not json", json.dumps([{"id": "p0", "summary": "Flaky crust"}])]
+
+        def fake_generate(prompt, max_output_tokens):
+            result = responses.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        monkeypatch.setattr(gs, "_generate", fake_generate)
+        assert gs.summarize_places(self._places(1), "bakery") == {"p0": "Flaky crust"}
+        assert 7 <= sleeps[0] <= 7 + gs.BACKOFF_BASE
+        assert 0 <= sleeps[1] <= gs.BACKOFF_BASE * 2
+
+    def test_long_retry_hint_gives_up(self, gemini, monkeypatch):
+        gs, sleeps = gemini
+        calls = []
+
+        def fake_generate(prompt, max_output_tokens):
+            calls.append(prompt)
+            raise RuntimeError("429 Quota exceeded for the day, retry in 3600s")
+
+        monkeypatch.setattr(gs, "_generate", fake_generate)
+        assert gs.summarize_places(self._places(2), "bakery") == {}
+        assert len(calls) == 1
+        assert sleeps == []
+
+    def test_non_retryable_error_gives_up(self, gemini, monkeypatch):
+        gs, sleeps = gemini
+
+        def fake_generate(prompt, max_output_tokens):
+            raise RuntimeError("API key not valid")
+
+        monkeypatch.setattr(gs, "_generate", fake_generate)
+        assert gs.summarize_places(self._places(2), "bakery") == {}
+        assert sleeps == []